@@ -0,0 +1,169 @@
+import csv
+import io
+import logging
+import threading
+import time
+
+from storage import connect
+
+logger = logging.getLogger(__name__)
+
+# Крок, з якого чат уперше потрапив до воронки (після перезапуску процесу — теж)
+ENTRY = "-"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS funnel_hourly (
+    hour TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (hour, source, target)
+);
+CREATE TABLE IF NOT EXISTS funnel_daily (
+    day TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, source, target)
+);
+"""
+
+UPSERT_HOURLY = (
+    "INSERT INTO funnel_hourly (hour, source, target, count) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(hour, source, target) DO UPDATE SET count = count + excluded.count"
+)
+UPSERT_DAILY = (
+    "INSERT INTO funnel_daily (day, source, target, count) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(day, source, target) DO UPDATE SET count = count + excluded.count"
+)
+
+
+def _day(days_ago=0):
+    return time.strftime("%Y-%m-%d", time.gmtime(time.time() - days_ago * 86400))
+
+
+# Лічильники одного потоку. Блокування бере лише сам потік і (раз на flush_interval) фоновий запис,
+# тож на шляху обробника воно фактично ніколи не чекає
+class _Shard:
+    __slots__ = ("counts", "last", "lock")
+
+    def __init__(self):
+        self.counts = {}
+        self.last = {}
+        self.lock = threading.Lock()
+
+
+# Аналітика воронки: переходи «попередній крок → крок» рахуються в пам'яті потоку-обробника
+# (оновлення одного чату завжди обробляє той самий потік диспетчера, тож і попередній крок чату
+# зберігається в ньому ж) і періодично додаються в погодинні та денні зведення в SQLite (UTC).
+# Звіти читають лише зведення.
+class FunnelStats:
+    def __init__(self, path, flush_interval=60, retention_days=35, max_chats=10000):
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.max_chats = max_chats
+        self._conn = connect(path, SCHEMA)
+        self._db_lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._thread = None
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    # Виклик з обробника: кілька операцій зі словниками, без звернення до диска
+    def record(self, chat_id, step):
+        shard = self._shard()
+        last = shard.last
+        source = last.pop(chat_id, ENTRY)
+        last[chat_id] = step
+        if len(last) > self.max_chats:
+            del last[next(iter(last))]  # Найдавніше активний чат
+        key = (int(time.time()) // 3600, source, step)
+        with shard.lock:
+            shard.counts[key] = shard.counts.get(key, 0) + 1
+
+    def flush(self):
+        with self._shards_lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            with shard.lock:
+                counts, shard.counts = shard.counts, {}
+            for key, count in counts.items():
+                merged[key] = merged.get(key, 0) + count
+        if not merged:
+            return 0
+        hourly, daily = [], {}
+        for (hour, source, target), count in merged.items():
+            started = time.gmtime(hour * 3600)
+            hourly.append((time.strftime("%Y-%m-%d %H:00", started), source, target, count))
+            day_key = (time.strftime("%Y-%m-%d", started), source, target)
+            daily[day_key] = daily.get(day_key, 0) + count
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(UPSERT_HOURLY, hourly)
+            self._conn.executemany(UPSERT_DAILY, [key + (count,) for key, count in daily.items()])
+            # Погодинні дані потрібні лише для недавнього періоду, денні зберігаються без обмежень
+            self._conn.execute("DELETE FROM funnel_hourly WHERE hour < ?", (_day(self.retention_days),))
+            self._conn.execute("COMMIT")
+        return len(merged)
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error("Помилка запису аналітики: %s", e)
+
+        self._thread = threading.Thread(target=run, name="funnel-flush", daemon=True)
+        self._thread.start()
+
+    # Перегляди кожного кроку та скільки разів з нього перейшли далі — за останні days днів
+    def summary(self, days=7):
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT source, target, SUM(count) FROM funnel_daily WHERE day >= ? GROUP BY source, target",
+                (_day(days - 1),)
+            ).fetchall()
+        views, onward = {}, {}
+        for source, target, count in rows:
+            views[target] = views.get(target, 0) + count
+            onward[source] = onward.get(source, 0) + count
+        return views, onward
+
+    # CSV зі зведення: period,source,target,count
+    def export_csv(self, days=30, hourly=False):
+        table, column = ("funnel_hourly", "hour") if hourly else ("funnel_daily", "day")
+        with self._db_lock:
+            rows = self._conn.execute(
+                f"SELECT {column}, source, target, count FROM {table} WHERE {column} >= ? ORDER BY {column}, source, target",
+                (_day(days - 1),)
+            ).fetchall()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(("period", "source", "target", "count"))
+        writer.writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+
+# Текст звіту для /stats: найпопулярніші кроки та частка тих, хто пішов далі
+def format_funnel(views, onward, days, limit=20):
+    if not views:
+        return f"За {days} дн. даних ще немає (зведення оновлюються у фоні)."
+    lines = [f"📊 Воронка за {days} дн. (UTC): перегляди → далі"]
+    for step, count in sorted(views.items(), key=lambda item: -item[1])[:limit]:
+        continued = min(onward.get(step, 0), count)
+        lines.append(f"{step}: {count} → {continued} ({continued * 100 // count}%)")
+    return "\n".join(lines)
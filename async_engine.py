@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import time
+
+from telebot import asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_handler_backends import BaseMiddleware, CancelUpdate
+
+import metrics
+from logsetup import bind_context, reset_context
+from routing import observe_handler
+
+logger = logging.getLogger(__name__)
+
+# Inline-запити не обмежуються: повторні відповіді Telegram бере зі свого кешу
+RATE_LIMITED_UPDATES = ["message", "callback_query"]
+
+
+# AsyncTeleBot із вимірюванням часу та кодів помилок запитів до Bot API (ті самі метрики,
+# що й у синхронного InstrumentedTeleBot); завершення getUpdates фіксується для /health.
+# З журналом (offsets.UpdateJournal) — як і синхронний рушій: повторні доставки відкидаються,
+# а Telegram як offset підтверджуються всі прийняті оновлення
+class InstrumentedAsyncTeleBot(AsyncTeleBot):
+    journal = None
+    duplicate_pause = 0.5
+
+    @property
+    def offset(self):
+        if self.journal is not None:
+            return self.journal.acknowledged + 1
+        return self._offset
+
+    @offset.setter
+    def offset(self, value):
+        self._offset = value
+
+    async def _timed(self, method, call, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await call(*args, **kwargs)
+        except asyncio_helper.ApiTelegramException as e:
+            metrics.api_errors_total.inc(method, str(e.error_code))
+            raise
+        except Exception:
+            metrics.api_errors_total.inc(method, "network")
+            raise
+        finally:
+            metrics.api_latency.observe(time.perf_counter() - started, method)
+
+    async def send_message(self, *args, **kwargs):
+        return await self._timed("send_message", super().send_message, *args, **kwargs)
+
+    async def edit_message_text(self, *args, **kwargs):
+        return await self._timed("edit_message_text", super().edit_message_text, *args, **kwargs)
+
+    async def answer_callback_query(self, *args, **kwargs):
+        return await self._timed("answer_callback_query", super().answer_callback_query, *args, **kwargs)
+
+    # Тривалість long-poll не показова, тому фіксуємо лише факт завершення getUpdates
+    async def get_updates(self, *args, **kwargs):
+        try:
+            result = await super().get_updates(*args, **kwargs)
+        except asyncio_helper.ApiTelegramException as e:
+            metrics.api_errors_total.inc("get_updates", str(e.error_code))
+            raise
+        except Exception:
+            metrics.api_errors_total.inc("get_updates", "network")
+            raise
+        metrics.poll_completed()
+        if self.journal is None or not result:
+            return result
+        accepted = [update for update in result if self.journal.accept(update.update_id)]
+        if len(accepted) < len(result):
+            metrics.duplicate_updates_total.inc(amount=len(result) - len(accepted))
+        if not accepted:
+            # Повторна доставка вже прийнятих оновлень (рідко, напр. після перезапуску) — не крутимо цикл
+            await asyncio.sleep(self.duplicate_pause)
+        return accepted
+
+    # Обробники всіх оновлень пачки завершуються до повернення з батьківського методу
+    async def process_new_updates(self, updates):
+        try:
+            await super().process_new_updates(updates)
+        finally:
+            if self.journal is not None:
+                for update in updates:
+                    self.journal.done(update.update_id)
+
+
+# Асинхронний rate limit: той самий TokenBucketLimiter, що й у синхронному рушії.
+# Сховище в SQLite блокує потік, тому тоді перевірка виконується поза event loop
+class AsyncRateLimitMiddleware(BaseMiddleware):
+    def __init__(self, bot, limiter, update_types):
+        super().__init__()
+        self.update_types = update_types
+        self.bot = bot
+        self.limiter = limiter
+
+    async def pre_process(self, message, data):
+        if isinstance(message, types.CallbackQuery):
+            kind, chat_id = "callback_query", message.from_user.id
+        else:
+            kind, chat_id = "message", message.chat.id
+        metrics.update_received(kind)
+        if self.limiter.store.blocking:
+            allowed = await asyncio.to_thread(self.limiter.allow, kind, chat_id)
+        else:
+            allowed = self.limiter.allow(kind, chat_id)
+        if allowed:
+            return None
+        logger.info("Rate limit: пропущено %s від %s", kind, chat_id)
+        metrics.rate_limited_total.inc(kind)
+        if kind == "callback_query":
+            try:
+                await self.bot.answer_callback_query(message.id)
+            except Exception as e:
+                logger.error("Помилка відповіді на пропущений callback: %s", e)
+        return CancelUpdate()
+
+    async def post_process(self, message, data, exception):
+        pass
+
+
+# Рушій на AsyncTeleBot: getUpdates і відповіді на callback/inline-запити йдуть через одну спільну
+# aiohttp-сесію з keep-alive з'єднаннями, а кількість одночасних обробників обмежена семафором.
+# Сама обробка — спільний із синхронним рушієм routing.UpdateRouter: екрани йдуть через чергу
+# відправки (outbox.SendScheduler) з глобальним і per-chat обмеженням та повтором після 429.
+# Роутер може звертатися до SQLite (заявки), тому виконується поза event loop
+class AsyncEngine:
+    def __init__(self, token, limiter, router, tariff_index=None, inline_cache_time=300, journal=None,
+                 admin_commands=None, is_admin=None, concurrency=50, connection_limit=50, allowed_updates=None):
+        # Розмір пулу з'єднань сесії, яку telebot створює один раз на процес
+        asyncio_helper.REQUEST_LIMIT = connection_limit
+        self.bot = InstrumentedAsyncTeleBot(token)
+        self.bot.journal = journal
+        self.router = router
+        self.tariff_index = tariff_index
+        self.inline_cache_time = inline_cache_time
+        self.allowed_updates = allowed_updates
+        self._slots = asyncio.Semaphore(concurrency)
+        self.bot.setup_middleware(AsyncRateLimitMiddleware(self.bot, limiter, RATE_LIMITED_UPDATES))
+        self.bot.register_message_handler(self.handle_start, commands=['start'])
+        # Команди адміністраторів — ті самі синхронні обробники, що й у TeleBot (відповідають через outbox)
+        for command, handler in (admin_commands or {}).items():
+            self.bot.register_message_handler(self.in_thread(handler), commands=[command], func=is_admin)
+        self.bot.register_message_handler(
+            self.handle_lead_message,
+            func=lambda message: router.lead_active(message.chat.id),
+            content_types=['text', 'contact']
+        )
+        self.bot.register_callback_query_handler(self.handle_query, func=lambda call: True)
+        if tariff_index is not None:
+            self.bot.register_inline_handler(self.handle_inline, func=lambda query: True)
+
+    @staticmethod
+    def in_thread(handler):
+        async def run(message):
+            await asyncio.to_thread(handler, message)
+        return run
+
+    async def handle_start(self, message):
+        token = bind_context(chat_id=message.chat.id)
+        try:
+            async with self._slots:
+                started = time.perf_counter()
+                logger.info("Отримано команду /start від %s", message.chat.id)
+                await asyncio.to_thread(self.router.start, message.chat.id)
+                observe_handler("start", started, message.chat.id, "/start оброблено")
+        finally:
+            reset_context(token)
+
+    async def handle_lead_message(self, message):
+        phone = message.contact.phone_number if message.contact else None
+        token = bind_context(chat_id=message.chat.id)
+        try:
+            await asyncio.to_thread(self.router.lead_message, message.chat.id, message.text, phone)
+        finally:
+            reset_context(token)
+
+    async def handle_query(self, call):
+        chat_id = call.message.chat.id
+        token = bind_context(chat_id=chat_id)
+        try:
+            async with self._slots:
+                started = time.perf_counter()
+                logger.info("Отримано callback: %s від %s", call.data, chat_id)
+                try:
+                    await asyncio.to_thread(
+                        self.router.callback, chat_id, call.message.message_id, call.data, call.from_user.username
+                    )
+                    await self.bot.answer_callback_query(call.id)
+                except Exception as e:
+                    logger.error("Помилка обробки callback %s: %s", call.data, e)
+                    await self.bot.answer_callback_query(call.id, "Виникла помилка. Спробуйте ще раз.")
+                observe_handler(self.router.callback_label(call.data), started, chat_id, "Callback %s оброблено", call.data)
+        finally:
+            reset_context(token)
+
+    # Пошук синхронний і не блокує: індекс у пам'яті, тож семафор не потрібен
+    async def handle_inline(self, query):
+        metrics.update_received("inline_query")
+        started = time.perf_counter()
+        try:
+            await self.bot.answer_inline_query(query.id, self.tariff_index.search(query.query), cache_time=self.inline_cache_time)
+        except Exception as e:
+            logger.error("Помилка відповіді на inline-запит %r: %s", query.query, e)
+        observe_handler("inline", started)
+
+    async def remove_webhook(self):
+        await self.bot.remove_webhook()
+
+    async def polling(self, timeout=20):
+        await self.bot.polling(non_stop=True, interval=0, timeout=timeout, allowed_updates=self.allowed_updates)
+
+    async def close(self):
+        await self.bot.close_session()
@@ -0,0 +1,150 @@
+import json
+import random
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Локальна заміна Bot API для навантажувальних тестів.
+# Підтримує getUpdates (long-poll з черги), sendMessage, editMessageText, answerCallbackQuery,
+# setWebhook/deleteWebhook; затримка відповіді та частка відповідей 429 налаштовуються.
+
+METHODS = ("getMe", "getUpdates", "sendMessage", "editMessageText", "answerCallbackQuery", "setWebhook", "deleteWebhook")
+
+
+class FakeBotAPI:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0, retry_after=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.injected_errors = Counter()
+        self._updates = deque()
+        self._updates_ready = threading.Condition()
+        self._listeners = []
+        self._message_id = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # Оновлення, які бот отримає через getUpdates
+    def push_update(self, update):
+        with self._updates_ready:
+            self._updates.append(update)
+            self._updates_ready.notify()
+
+    # listener(method, params, timestamp) викликається на кожен запит бота
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Заголовки й тіло відповіді йдуть окремими сегментами: з алгоритмом Nagle та
+            # відкладеним ACK кожен запит отримував би ~40 мс зайвої затримки понад --latency
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                self._handle()
+
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self):
+                url = urlparse(self.path)
+                method = url.path.rsplit("/", 1)[-1]
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    body = self.rfile.read(length).decode("utf-8")
+                    if "json" in (self.headers.get("Content-Type") or ""):
+                        params.update(json.loads(body))
+                    else:
+                        params.update({k: v[0] for k, v in parse_qs(body).items()})
+                status, payload = api._dispatch(method, params)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def _dispatch(self, method, params):
+        if method not in METHODS:
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"}
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": self._get_updates(params)}
+
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            self.calls[method] += 1
+        if method in ("sendMessage", "editMessageText") and random.random() < self.error_rate:
+            with self._lock:
+                self.injected_errors[method] += 1
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        now = time.perf_counter()
+        for listener in self._listeners:
+            listener(method, params, now)
+        return 200, {"ok": True, "result": self._result(method, params)}
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + timeout
+        with self._updates_ready:
+            # Підтверджені (update_id < offset) оновлення видаляються, як у справжньому API
+            while self._updates and self._updates[0]["update_id"] < offset:
+                self._updates.popleft()
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._updates_ready.wait(remaining)
+            return [u for u in list(self._updates)[:limit] if u["update_id"] >= offset]
+
+    def _result(self, method, params):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if method in ("sendMessage", "editMessageText"):
+            with self._lock:
+                self._message_id += 1
+                message_id = int(params.get("message_id") or self._message_id)
+            return {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id") or 0), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        return True
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import deque
+
+from bench.fake_api import FakeBotAPI
+
+# Навантажувальний тест бота проти локальної заміни Bot API.
+# Приклад (з кореня репозиторію):
+#   python -m bench.load --rate 200 --duration 30 --chats 2000 --latency 0.05 --error-rate 0.01
+# Для порівняння запусків використовуйте --json і зберігайте результат.
+
+BENCH_TOKEN = "123456:BENCH"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Навантажувальний тест Telegram-бота")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--engine", choices=("sync", "async"), default="sync", help="async — лише з --mode polling")
+    parser.add_argument("--rate", type=float, default=50, help="оновлень на секунду")
+    parser.add_argument("--duration", type=float, default=10, help="тривалість подачі оновлень, сек")
+    parser.add_argument("--drain", type=float, default=10, help="скільки чекати відповідей після подачі, сек")
+    parser.add_argument("--chats", type=int, default=500, help="кількість різних користувачів")
+    parser.add_argument("--start-share", type=float, default=0.2, help="частка /start серед оновлень")
+    parser.add_argument("--latency", type=float, default=0.02, help="затримка відповіді API, сек")
+    parser.add_argument("--jitter", type=float, default=0.01, help="випадкова добавка до затримки, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="частка відповідей 429 на send/edit")
+    parser.add_argument("--no-journal", action="store_true",
+                        help="polling без журналу offset (для порівняння: журнал не має додавати затримки)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="вивести результат у JSON")
+    return parser.parse_args(argv)
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[index]
+
+
+def latency_summary(latencies):
+    return {
+        name: None if value is None else round(value * 1000, 2)
+        for name, value in (
+            ("p50", percentile(latencies, 0.50)),
+            ("p95", percentile(latencies, 0.95)),
+            ("p99", percentile(latencies, 0.99)),
+            ("max", latencies[-1] if latencies else None),
+        )
+    }
+
+
+# Налаштування середовища до імпорту main: бот, БД і логи ізольовані від робочих
+def prepare_environment(args, workdir):
+    os.environ.update({
+        "BOT_TOKEN": BENCH_TOKEN,
+        "BOT_MODE": args.mode,
+        "BOT_ENGINE": args.engine,
+        "WEBHOOK_URL": "http://127.0.0.1",
+        "WEBHOOK_SECRET": "bench-secret",
+        "BOT_DB": os.path.join(workdir, "bench.db"),
+        "OFFSET_JOURNAL": os.path.join(workdir, "bench.offset"),
+        "LOG_FILE": "",
+        "LOG_LEVEL": "WARNING",
+        "SCREENS_RELOAD_INTERVAL": "0",
+    })
+
+
+class UpdateFactory:
+    def __init__(self, callbacks, chats, start_share, rng):
+        self.callbacks = callbacks
+        self.chats = chats
+        self.start_share = start_share
+        self.rng = rng
+        self.update_id = 0
+
+    def next(self):
+        self.update_id += 1
+        chat_id = 1000 + self.rng.randrange(self.chats)
+        user = {"id": chat_id, "is_bot": False, "first_name": "Bench"}
+        chat = {"id": chat_id, "type": "private"}
+        now = int(time.time())
+        if self.rng.random() < self.start_share:
+            return "start", chat_id, {
+                "update_id": self.update_id,
+                "message": {
+                    "message_id": self.update_id, "from": user, "chat": chat, "date": now, "text": "/start",
+                    "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+                },
+            }
+        return "callback", chat_id, {
+            "update_id": self.update_id,
+            "callback_query": {
+                "id": str(self.update_id), "from": user, "chat_instance": str(chat_id),
+                "data": self.rng.choice(self.callbacks),
+                "message": {"message_id": 1, "from": user, "chat": chat, "date": now, "text": "menu"},
+            },
+        }
+
+
+# Наскрізна затримка: від подачі оновлення до показу екрана — sendMessage/editMessageText у цей чат
+# (у межах чату — за порядком; об'єднані черговою відправки редагування з тим самим текстом
+# зараховуються одним викликом). Окремо — до answerCallbackQuery, тобто зникнення «годинника» на кнопці.
+class LatencyTracker:
+    def __init__(self):
+        self.latencies = []
+        self.spinner_latencies = []
+        self.skipped_edits = 0
+        self._pending_callbacks = {}
+        self._pending_screens = {}
+        self._shown = {}
+        self._lock = threading.Lock()
+
+    # screen — очікуваний екран (його текст і дія send/edit)
+    def submitted(self, kind, chat_id, update, screen, at):
+        with self._lock:
+            if kind == "callback":
+                self._pending_callbacks[update["callback_query"]["id"]] = at
+            pending = self._pending_screens.setdefault(chat_id, deque())
+            if screen.action == "edit" and not pending and self._shown.get(chat_id) == screen.text:
+                # Повідомлення вже показує цей екран — бот пропускає редагування (render cache)
+                self.skipped_edits += 1
+                return
+            pending.append((at, screen.text))
+
+    def on_api_call(self, method, params, at):
+        with self._lock:
+            if method == "answerCallbackQuery":
+                started = self._pending_callbacks.pop(params.get("callback_query_id"), None)
+                if started is not None:
+                    self.spinner_latencies.append(at - started)
+            elif method in ("sendMessage", "editMessageText"):
+                chat_id = int(params.get("chat_id") or 0)
+                text = params.get("text")
+                if method == "editMessageText":
+                    self._shown[chat_id] = text
+                pending = self._pending_screens.get(chat_id)
+                if pending:
+                    self.latencies.append(at - pending.popleft()[0])
+                    while pending and pending[0][1] == text:
+                        self.latencies.append(at - pending.popleft()[0])
+
+    def outstanding(self):
+        with self._lock:
+            return len(self._pending_callbacks) + sum(len(q) for q in self._pending_screens.values())
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    prepare_environment(args, workdir)
+
+    api = FakeBotAPI(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate).start()
+    from telebot import apihelper
+    apihelper.API_URL = api.api_url
+    if args.engine == "async":
+        from telebot import asyncio_helper
+        asyncio_helper.API_URL = api.api_url
+
+    rss_before_import = rss_bytes()
+    import main
+    main.startup()
+    if args.no_journal:
+        main.bot.journal = None
+
+    tracker = LatencyTracker()
+    api.add_listener(tracker.on_api_call)
+
+    if args.engine == "async":
+        import asyncio
+        engine = main.create_async_engine()
+        if args.no_journal:
+            engine.bot.journal = None
+        threading.Thread(target=asyncio.run, args=(engine.polling(timeout=1),), daemon=True).start()
+        deliver = api.push_update
+    elif args.mode == "polling":
+        threading.Thread(
+            target=main.bot.polling,
+            kwargs={"non_stop": True, "interval": 0, "timeout": 5, "long_polling_timeout": 1},
+            daemon=True
+        ).start()
+        deliver = api.push_update
+    else:
+        client = main.create_app().test_client()
+        headers = {"X-Telegram-Bot-Api-Secret-Token": "bench-secret"}
+
+        def deliver(update):
+            client.post("/webhook/bench-secret", json=update, headers=headers)
+
+    callbacks = sorted(key for key in main.screens.keys() if key != "main_menu") + ["main_menu"]
+    factory = UpdateFactory(callbacks, args.chats, args.start_share, random.Random(args.seed))
+
+    rss_start = rss_bytes()
+    interval = 1.0 / args.rate
+    submitted = 0
+    started = time.perf_counter()
+    next_at = started
+    while time.perf_counter() - started < args.duration:
+        kind, chat_id, update = factory.next()
+        key = update["callback_query"]["data"] if kind == "callback" else "main_menu"
+        tracker.submitted(kind, chat_id, update, main.screens.get(key), time.perf_counter())
+        deliver(update)
+        submitted += 1
+        next_at += interval
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    feed_elapsed = time.perf_counter() - started
+
+    drain_deadline = time.perf_counter() + args.drain
+    while tracker.outstanding() and time.perf_counter() < drain_deadline:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(tracker.latencies)
+    spinner_latencies = sorted(tracker.spinner_latencies)
+    result = {
+        "mode": args.mode,
+        "engine": args.engine,
+        "target_rate": args.rate,
+        "submitted": submitted,
+        "completed": len(latencies),
+        "unanswered": tracker.outstanding(),
+        "offered_rate": round(submitted / feed_elapsed, 1),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "latency_ms": latency_summary(latencies),
+        "spinner_ms": latency_summary(spinner_latencies),
+        "skipped_edits": tracker.skipped_edits,
+        "api_calls": dict(api.calls),
+        "injected_429": dict(api.injected_errors),
+        "rate_limited": sum(main.metrics.rate_limited_total.value(kind) for kind in ("message", "callback_query")),
+        "outbox_depth": main.outbox.depth(),
+        "rss_mb": {
+            "import": round((rss_start - rss_before_import) / 2 ** 20, 1),
+            "growth": round((rss_bytes() - rss_start) / 2 ** 20, 1),
+        },
+    }
+    api.stop()
+    return result
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        for key, value in result.items():
+            print(f"{key:>14}: {value}")
+    # Фонові потоки бота не зупиняються штатно, тому завершуємо процес явно
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    cli()
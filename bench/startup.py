@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench.fake_api import FakeBotAPI
+
+# Вимірювання холодного старту:
+#  1. python -X importtime -c "import main" — час імпорту та найдорожчі модулі;
+#     модулі з --forbid не повинні імпортуватися разом з main (їх імпорт відкладено).
+#  2. python main.py проти локальної заміни Bot API — час від запуску процесу до відповіді на /start.
+# Приклад (з кореня репозиторію):
+#   python -m bench.startup --import-budget-ms 400 --reply-budget-ms 1000
+# Код виходу 1, якщо перевищено бюджет або імпортовано заборонений модуль.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_TOKEN = "123456:BENCH"
+DEFAULT_FORBID = "flask,werkzeug,jinja2,aiohttp,async_engine"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Холодний старт Telegram-бота")
+    parser.add_argument("--import-budget-ms", type=float, default=None, help="допустимий час імпорту main")
+    parser.add_argument("--reply-budget-ms", type=float, default=1000, help="допустимий час до відповіді на /start")
+    parser.add_argument("--forbid", default=DEFAULT_FORBID, help="модулі, які не мають імпортуватися з main")
+    parser.add_argument("--top", type=int, default=10, help="скільки найдорожчих імпортів показати")
+    parser.add_argument("--timeout", type=float, default=30, help="скільки чекати відповіді на /start, сек")
+    parser.add_argument("--json", action="store_true", help="вивести результат у JSON")
+    return parser.parse_args(argv)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bot_environment(workdir, **extra):
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": BENCH_TOKEN,
+        "BOT_MODE": "polling",
+        "BOT_ENGINE": "sync",
+        "BOT_DB": os.path.join(workdir, "bench.db"),
+        "OFFSET_JOURNAL": os.path.join(workdir, "bench.offset"),
+        "LOG_FILE": "",
+        "PORT": str(free_port()),
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    env.update(extra)
+    return env
+
+
+# Рядки stderr виду "import time:  self [us] | cumulative | imported package"
+def parse_importtime(stderr):
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # Після "|" один пробіл, далі відступ за рівнем вкладеності
+        modules.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def measure_import(args, workdir):
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, env=bot_environment(workdir), capture_output=True, text=True, timeout=args.timeout
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import main завершився з кодом {completed.returncode}:\n{completed.stderr[-2000:]}")
+    modules = parse_importtime(completed.stderr)
+    # Прямі імпорти main (відступ на один рівень) — саме їх варто відкладати
+    direct = sorted((m for m in modules if m[0].startswith("  ") and not m[0].startswith("    ")), key=lambda m: -m[2])
+    imported = {name.strip() for name, _, _ in modules}
+    forbidden = [name for name in args.forbid.split(",") if name and name in imported]
+    return {
+        "total_ms": round(sum(self_us for _, self_us, _ in modules) / 1000, 1),
+        "top": [{"module": name.strip(), "cumulative_ms": round(cumulative / 1000, 1)} for name, _, cumulative in direct[:args.top]],
+        "forbidden_imported": forbidden,
+    }
+
+
+def measure_first_reply(args, workdir):
+    api = FakeBotAPI().start()
+    api.push_update({
+        "update_id": 1,
+        "message": {
+            "message_id": 1, "date": int(time.time()), "text": "/start",
+            "from": {"id": 1000, "is_bot": False, "first_name": "Bench"},
+            "chat": {"id": 1000, "type": "private"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    })
+    replied = threading.Event()
+    api.add_listener(lambda method, params, at: method == "sendMessage" and replied.set())
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "main.py"],
+        cwd=ROOT, env=bot_environment(workdir, BOT_API_URL=api.api_url),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    try:
+        ok = replied.wait(args.timeout)
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        _, stderr = process.communicate(timeout=10)
+        api.stop()
+    report = next((line for line in stderr.splitlines() if "Старт завершено" in line), None)
+    return {
+        "first_reply_ms": round(elapsed * 1000, 1) if ok else None,
+        "startup_report": report,
+        "api_calls": dict(api.calls),
+    }
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="bot-startup-")
+    result = {
+        "import": measure_import(args, workdir),
+        "first_reply": measure_first_reply(args, workdir),
+    }
+
+    failures = []
+    if result["import"]["forbidden_imported"]:
+        failures.append(f"імпортовано разом з main: {', '.join(result['import']['forbidden_imported'])}")
+    if args.import_budget_ms is not None and result["import"]["total_ms"] > args.import_budget_ms:
+        failures.append(f"імпорт {result['import']['total_ms']} мс > {args.import_budget_ms} мс")
+    reply_ms = result["first_reply"]["first_reply_ms"]
+    if reply_ms is None or reply_ms > args.reply_budget_ms:
+        failures.append(f"відповідь на /start {reply_ms} мс > {args.reply_budget_ms} мс")
+    result["failures"] = failures
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print(f"import main: {result['import']['total_ms']} мс")
+        for item in result["import"]["top"]:
+            print(f"  {item['cumulative_ms']:>8} мс  {item['module']}")
+        print(f"перша відповідь на /start: {reply_ms} мс")
+        print(f"  {result['first_reply']['startup_report']}")
+        for failure in failures:
+            print(f"ПОМИЛКА: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,57 @@
+import itertools
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+# Розподіл оновлень між потоками за chat_id: оновлення одного чату обробляються
+# по черзі в одному потоці, різні чати — паралельно. Черги партицій обмежені:
+# submit(block=True) чекає на місце (зворотний тиск для polling),
+# submit(block=False) одразу повертає False (webhook відповідає 503).
+class PartitionedDispatcher:
+    def __init__(self, handle, partition_key, workers=4, queue_size=100):
+        self.handle = handle
+        self.partition_key = partition_key
+        self._queues = [queue.Queue(queue_size) for _ in range(workers)]
+        self._fallback = itertools.count()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        for index, partition in enumerate(self._queues):
+            thread = threading.Thread(target=self._run, args=(partition,), name=f"dispatch-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _partition(self, update):
+        key = self.partition_key(update)
+        if key is None:
+            # Оновлення без чату не мають порядку, тож розкладаємо їх по колу
+            key = next(self._fallback)
+        return self._queues[hash(key) % len(self._queues)]
+
+    def submit(self, update, block=True, timeout=None):
+        try:
+            self._partition(update).put(update, block=block, timeout=timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def depth(self):
+        return sum(partition.qsize() for partition in self._queues)
+
+    def saturated(self):
+        return any(partition.full() for partition in self._queues)
+
+    def _run(self, partition):
+        while True:
+            update = partition.get()
+            try:
+                self.handle(update)
+            except Exception as e:
+                logger.error("Помилка обробки оновлення %s: %s", update.update_id, e)
+            finally:
+                partition.task_done()
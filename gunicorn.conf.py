@@ -1,4 +1,29 @@
-workers = 1
-threads = 2
+import os
+
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+threads = int(os.getenv("GUNICORN_THREADS", 2))
 timeout = 30
-bind = "0.0.0.0:10000"
+bind = f"0.0.0.0:{os.getenv('PORT', 10000)}"
+
+
+# gunicorn — точка входу лише для режиму webhook (див. Procfile); polling запускається через python main.py.
+# main імпортується лише у воркерах, після fork: майстер не повинен передавати їм
+# свої потоки, з'єднання SQLite та HTTP-сокети. Webhook реєструє перший воркер
+# (age == 1) — один раз на запуск, а не кожен воркер і не після перезапуску воркера
+def post_worker_init(worker):
+    if os.getenv("BOT_MODE", "polling").lower() != "webhook":
+        worker.log.error("gunicorn обслуговує лише BOT_MODE=webhook; для polling запускайте python main.py")
+        return
+
+    from main import startup, setup_webhook
+
+    def register_webhook():
+        try:
+            setup_webhook()
+        except Exception as e:
+            worker.log.error(f"Помилка встановлення webhook: {e}")
+
+    steps = {}
+    if worker.age == 1:
+        steps["webhook"] = register_webhook
+    startup(**steps)
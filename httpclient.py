@@ -0,0 +1,83 @@
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Повтор лише для запитів, які можна безпечно надіслати ще раз: у telebot це GET
+# (getUpdates, getMe, getWebhookInfo), а send/edit/answer йдуть POST-ом.
+# Помилки встановлення з'єднання повторюються для будь-якого методу — запит ще не надіслано.
+# Тайм-аути читання не повторюються: для long-poll getUpdates кожна спроба триває до READ_TIMEOUT,
+# і кілька повторів поспіль перевищили б HEALTH_POLL_STALL; polling сам перезапустить запит.
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS"])
+RETRY_STATUSES = (500, 502, 503, 504)  # 429 обробляє черга відправки з урахуванням retry_after
+
+
+# Спільна сесія: keep-alive з'єднання в пулі на кожен хост, тож TLS-рукостискання
+# відбувається один раз на з'єднання, а не на кожен запит
+def create_session(pool_size=10, retries=3, backoff=0.5):
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=False,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=IDEMPOTENT_METHODS,
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Скільки з'єднань відкрито і скільки запитів ними виконано (лічильники пулів urllib3).
+# Чим більше запитів на з'єднання, тим менше повторних рукостискань
+def connection_stats(session):
+    opened = sent = 0
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                sent += pool.num_requests
+    return opened, sent
+
+
+# Періодичний запит на власний /health, щоб хостинг не «присипляв» процес у режимі polling
+# (вхідних HTTP-запитів тоді немає). Окремий потік зі своїм розкладом, обмежений тайм-аутом
+class KeepAlivePinger:
+    def __init__(self, session, url, interval=600, timeout=(5, 10)):
+        self.session = session
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self._thread = None
+
+    def ping(self):
+        try:
+            response = self.session.get(self.url, timeout=self.timeout)
+            opened, sent = connection_stats(self.session)
+            logger.info("Keep-alive ping: %s (HTTP: %s з'єднань на %s запитів)", response.status_code, opened, sent)
+        except Exception as e:
+            logger.error("Помилка keep-alive: %s", e)
+
+    def start(self):
+        if not self.url or self.interval <= 0 or self._thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.interval)
+                self.ping()
+
+        self._thread = threading.Thread(target=run, name="keep-alive", daemon=True)
+        self._thread.start()
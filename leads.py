@@ -0,0 +1,418 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from telebot.types import (
+    InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+)
+
+from storage import connect
+
+logger = logging.getLogger(__name__)
+
+# Тарифи, які можна обрати в заявці (ключі збігаються з екранами тарифів)
+TARIFFS = OrderedDict([
+    ("fop1", "ФОП 1 група"),
+    ("fop2", "ФОП 2 група"),
+    ("fop3nopdv", "ФОП 3 група (без ПДВ)"),
+    ("fop3pdv", "ФОП 3 група (з ПДВ)"),
+    ("fop_staff", "ФОП з працівниками"),
+    ("fop_general", "ФОП на загальній системі"),
+    ("llc", "ТОВ/ПП"),
+    ("reg_fop", "Реєстрація ФОП"),
+    ("close_fop", "Закриття ФОП"),
+    ("decl_fop", "Декларація ФОП на ЄП"),
+])
+CONTACT_METHODS = OrderedDict([
+    ("phone", "📞 Дзвінок"),
+    ("viber", "💬 Viber"),
+    ("telegram", "💬 Telegram"),
+    ("whatsapp", "💬 WhatsApp"),
+])
+
+ORDER = "order"
+ORDER_PREFIX = "order:"
+CONTACT_PREFIX = "lead_contact:"
+CANCEL = "lead_cancel"
+CANCEL_TEXT = "✖️ Скасувати заявку"
+CALLBACK_PREFIXES = (ORDER, CONTACT_PREFIX, CANCEL)
+
+# Callback-и заявки, на які можуть посилатися кнопки екранів
+CALLBACKS = frozenset(
+    [ORDER, CANCEL]
+    + [ORDER_PREFIX + key for key in TARIFFS]
+    + [CONTACT_PREFIX + key for key in CONTACT_METHODS]
+)
+
+STATE_TARIFF = "tariff"
+STATE_NAME = "name"
+STATE_PHONE = "phone"
+STATE_CONTACT = "contact"
+
+PHONE_DIGITS = re.compile(r"\d")
+PHONE_ALLOWED = re.compile(r"^[\d\s()+\-]+$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    chat_id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL,
+    data TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    tariff TEXT NOT NULL,
+    name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    contact TEXT NOT NULL,
+    username TEXT,
+    created REAL NOT NULL,
+    forwarded INTEGER NOT NULL DEFAULT 0,
+    claim_owner TEXT,
+    claim_until REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS leads_forwarded ON leads (forwarded, id);
+"""
+
+
+def _markup(buttons):
+    markup = InlineKeyboardMarkup(row_width=1)
+    markup.add(*[InlineKeyboardButton(text, callback_data=data) for text, data in buttons])
+    return markup.to_json()
+
+
+# Клавіатури заявки серіалізуються один раз при імпорті
+CANCEL_MARKUP = _markup([(CANCEL_TEXT, CANCEL)])
+TARIFF_MARKUP = _markup(
+    [(label, ORDER_PREFIX + key) for key, label in TARIFFS.items()] + [(CANCEL_TEXT, CANCEL)]
+)
+CONTACT_MARKUP = _markup(
+    [(label, CONTACT_PREFIX + key) for key, label in CONTACT_METHODS.items()] + [(CANCEL_TEXT, CANCEL)]
+)
+# На кроці телефону — звичайна клавіатура з кнопкою «поділитися контактом»
+# (inline-кнопки так не вміють); скасування там — текстом кнопки CANCEL_TEXT
+PHONE_MARKUP = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=1)
+PHONE_MARKUP.add(KeyboardButton("📱 Поділитися контактом", request_contact=True), KeyboardButton(CANCEL_TEXT))
+PHONE_MARKUP = PHONE_MARKUP.to_json()
+REMOVE_KEYBOARD = ReplyKeyboardRemove().to_json()
+
+
+# Стан розмов (FSM): LRU у пам'яті з TTL, зміни записуються в SQLite у фоні.
+# Після перезапуску незавершені розмови завантажуються з бази одним запитом,
+# тож під час роботи кеш є єдиним джерелом істини й база на кожне повідомлення не читається.
+# shared=True — кілька процесів (воркери gunicorn) працюють з однією базою: наступне повідомлення
+# чату може потрапити до іншого воркера, тому кеш вимкнено, а кожне звернення читає/пише SQLite
+# (один запит за первинним ключем)
+class ConversationStore:
+    def __init__(self, path, ttl=1800, max_entries=10000, flush_interval=2, shared=False):
+        self.ttl = ttl
+        self.shared = shared
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._conn = connect(path, SCHEMA)
+        self._cache = OrderedDict()
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def load(self):
+        cutoff = time.time() - self.ttl
+        self._conn.execute("DELETE FROM conversations WHERE updated < ?", (cutoff,))
+        if self.shared:
+            return
+        rows = self._conn.execute(
+            "SELECT chat_id, state, data, updated FROM conversations ORDER BY updated DESC LIMIT ?",
+            (self.max_entries,)
+        ).fetchall()
+        with self._lock:
+            for chat_id, state, data, updated in reversed(rows):
+                self._cache[chat_id] = (state, json.loads(data), updated)
+        logger.info("Відновлено %s незавершених заявок", len(rows))
+
+    def get(self, chat_id):
+        if self.shared:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT state, data, updated FROM conversations WHERE chat_id = ?", (chat_id,)
+                ).fetchone()
+            if row is None or time.time() - row[2] > self.ttl:
+                return None
+            return row[0], json.loads(row[1])
+        with self._lock:
+            entry = self._cache.get(chat_id)
+            if entry is None:
+                return None
+            if time.time() - entry[2] > self.ttl:
+                del self._cache[chat_id]
+                self._dirty[chat_id] = None
+                return None
+            return entry[0], dict(entry[1])
+
+    def set(self, chat_id, state, data):
+        entry = (state, dict(data), time.time())
+        if self.shared:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO conversations (chat_id, state, data, updated) VALUES (?, ?, ?, ?)",
+                    (chat_id, state, json.dumps(entry[1], ensure_ascii=False), entry[2])
+                )
+            return
+        with self._lock:
+            self._cache[chat_id] = entry
+            self._cache.move_to_end(chat_id)
+            self._dirty[chat_id] = entry
+            while len(self._cache) > self.max_entries:
+                evicted, _ = self._cache.popitem(last=False)
+                self._dirty[evicted] = None
+
+    def delete(self, chat_id):
+        if self.shared:
+            with self._lock:
+                self._conn.execute("DELETE FROM conversations WHERE chat_id = ?", (chat_id,))
+            return
+        with self._lock:
+            if self._cache.pop(chat_id, None) is not None:
+                self._dirty[chat_id] = None
+
+    def flush(self):
+        if self.shared:
+            # Записувати нічого — лише прибираємо прострочені розмови
+            with self._lock:
+                self._conn.execute("DELETE FROM conversations WHERE updated < ?", (time.time() - self.ttl,))
+            return
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        upserts = [(chat_id, e[0], json.dumps(e[1], ensure_ascii=False), e[2]) for chat_id, e in dirty.items() if e]
+        deletes = [(chat_id,) for chat_id, e in dirty.items() if e is None]
+        self._conn.execute("BEGIN")
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO conversations (chat_id, state, data, updated) VALUES (?, ?, ?, ?)", upserts
+        )
+        self._conn.executemany("DELETE FROM conversations WHERE chat_id = ?", deletes)
+        self._conn.execute("COMMIT")
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error("Помилка запису стану заявок: %s", e)
+
+        self._thread = threading.Thread(target=run, name="conversations-flush", daemon=True)
+        self._thread.start()
+
+
+# Завершені заявки зберігаються в SQLite і пересилаються в чат адміністраторів
+# пачками не частіше ніж раз на interval секунд. Форвардер працює в кожному воркері, тому пачка
+# спершу закріплюється за процесом (оренда на CLAIM_SECONDS, як у Broadcaster) і лише потім
+# відправляється — одну заявку не перешлють двічі
+class LeadForwarder:
+    CLAIM_SECONDS = 300
+
+    def __init__(self, path, outbox, admin_chat_id, interval=30, batch_size=10):
+        self.outbox = outbox
+        self.admin_chat_id = admin_chat_id
+        self.interval = interval
+        self.batch_size = batch_size
+        self.owner = f"{os.getpid()}-{id(self)}"
+        self._conn = connect(path, SCHEMA)
+        # Таблиця з попередньої версії — без колонок оренди
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(leads)")}
+        for column, definition in (("claim_owner", "TEXT"), ("claim_until", "REAL NOT NULL DEFAULT 0")):
+            if column not in columns:
+                try:
+                    self._conn.execute(f"ALTER TABLE leads ADD COLUMN {column} {definition}")
+                except sqlite3.OperationalError:
+                    pass  # Колонку щойно додав інший воркер
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, chat_id, data, username=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO leads (chat_id, tariff, name, phone, contact, username, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (chat_id, data["tariff"], data["name"], data["phone"], data["contact"], username, time.time())
+            )
+        self._wakeup.set()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if not self.admin_chat_id:
+            logger.warning("LEADS_CHAT_ID не встановлено: заявки зберігаються лише в базі")
+            return
+        self._thread = threading.Thread(target=self._run, name="lead-forwarder", daemon=True)
+        self._thread.start()
+        # Заявки, не переслані до перезапуску
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            # Раз на CLAIM_SECONDS — перевірка заявок, оренда яких сплила (воркер завершився)
+            self._wakeup.wait(self.CLAIM_SECONDS)
+            self._wakeup.clear()
+            try:
+                # Після кожної пачки чекаємо interval: заявки, що надійшли за цей час, підуть однією пачкою
+                while self._forward_batch():
+                    time.sleep(self.interval)
+            except Exception as e:
+                logger.error("Помилка пересилання заявок: %s", e)
+                time.sleep(self.interval)
+                self._wakeup.set()
+
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, chat_id, tariff, name, phone, contact, username, created FROM leads "
+                    "WHERE forwarded = 0 AND claim_until < ? ORDER BY id LIMIT ?",
+                    (now, self.batch_size)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE leads SET claim_owner = ?, claim_until = ? WHERE id = ?",
+                    [(self.owner, now + self.CLAIM_SECONDS, row[0]) for row in rows]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _forward_batch(self):
+        rows = self._claim()
+        if not rows:
+            return False
+        ids = [(row[0], self.owner) for row in rows]
+        try:
+            self.outbox.submit("send_message", self.admin_chat_id, text=format_leads(rows)).result(timeout=120)
+        except Exception:
+            # Звільняємо пачку, щоб її повторив будь-який воркер
+            with self._lock:
+                self._conn.executemany("UPDATE leads SET claim_until = 0 WHERE id = ? AND claim_owner = ?", ids)
+            raise
+        with self._lock:
+            self._conn.executemany("UPDATE leads SET forwarded = 1 WHERE id = ? AND claim_owner = ?", ids)
+        logger.info("Переслано заявок: %s", len(rows))
+        return True
+
+
+def format_leads(rows):
+    parts = [f"📝 Нові заявки на консультацію: {len(rows)}"]
+    for lead_id, chat_id, tariff, name, phone, contact, username, created in rows:
+        parts.append(
+            f"\n#{lead_id} — {time.strftime('%d.%m %H:%M', time.localtime(created))}\n"
+            f"Тариф: {TARIFFS.get(tariff, tariff)}\n"
+            f"Ім'я: {name}\n"
+            f"Телефон: {phone}\n"
+            f"Зв'язок: {CONTACT_METHODS.get(contact, contact)}\n"
+            f"Telegram: {'@' + username if username else chat_id}"
+        )
+    return "\n".join(parts)
+
+
+def normalize_phone(text):
+    text = text.strip()
+    digits = "".join(PHONE_DIGITS.findall(text))
+    if not PHONE_ALLOWED.match(text) or not 10 <= len(digits) <= 13:
+        return None
+    return ("+" if text.startswith("+") else "") + digits
+
+
+# Сценарій «Замовити консультацію»: тариф → ім'я → телефон → спосіб зв'язку.
+# send(chat_id, text, reply_markup) відправляє відповідь (через чергу відправки)
+class LeadFlow:
+    def __init__(self, store, forwarder, send):
+        self.store = store
+        self.forwarder = forwarder
+        self.send = send
+
+    def active(self, chat_id):
+        return self.store.get(chat_id) is not None
+
+    def start(self, chat_id, tariff=None):
+        if tariff in TARIFFS:
+            self.store.set(chat_id, STATE_NAME, {"tariff": tariff})
+            self.send(chat_id, f"Тариф: {TARIFFS[tariff]}\n\nЯк до Вас звертатися? Напишіть, будь ласка, Ваше ім'я.", CANCEL_MARKUP)
+        else:
+            self.store.set(chat_id, STATE_TARIFF, {})
+            self.send(chat_id, "Оберіть послугу, щодо якої потрібна консультація:", TARIFF_MARKUP)
+
+    def cancel(self, chat_id):
+        self.store.delete(chat_id)
+        self.send(chat_id, "Заявку скасовано. Щоб повернутися до меню, надішліть /start", REMOVE_KEYBOARD)
+
+    # Повертає False, якщо callback не стосується заявки
+    def on_callback(self, chat_id, data, username=None):
+        if data == CANCEL:
+            self.cancel(chat_id)
+        elif data == ORDER:
+            self.start(chat_id)
+        elif data.startswith(ORDER_PREFIX):
+            self.start(chat_id, data[len(ORDER_PREFIX):])
+        elif data.startswith(CONTACT_PREFIX):
+            conversation = self.store.get(chat_id)
+            method = data[len(CONTACT_PREFIX):]
+            if conversation is None or conversation[0] != STATE_CONTACT or method not in CONTACT_METHODS:
+                return True
+            lead = dict(conversation[1], contact=method)
+            self.forwarder.add(chat_id, lead, username)
+            self.store.delete(chat_id)
+            self.send(
+                chat_id,
+                "✅ Дякуємо! Заявку прийнято, наш бухгалтер зв'яжеться з Вами найближчим часом.\n"
+                "Щоб повернутися до меню, надішліть /start",
+                None
+            )
+        else:
+            return False
+        return True
+
+    def on_message(self, chat_id, text=None, phone=None):
+        conversation = self.store.get(chat_id)
+        if conversation is None:
+            return False
+        state, data = conversation
+        if state == STATE_TARIFF:
+            self.send(chat_id, "Оберіть послугу кнопкою нижче:", TARIFF_MARKUP)
+        elif state == STATE_NAME:
+            name = (text or "").strip()
+            if not 2 <= len(name) <= 100:
+                self.send(chat_id, "Введіть, будь ласка, ім'я (від 2 до 100 символів).", CANCEL_MARKUP)
+                return True
+            self.store.set(chat_id, STATE_PHONE, dict(data, name=name))
+            self.send(
+                chat_id,
+                "Вкажіть номер телефону для зв'язку, наприклад +380981234567, або натисніть «Поділитися контактом».",
+                PHONE_MARKUP
+            )
+        elif state == STATE_PHONE:
+            if phone is None and text == CANCEL_TEXT:
+                self.cancel(chat_id)
+                return True
+            normalized = normalize_phone(phone or text or "")
+            if normalized is None:
+                self.send(chat_id, "Не вдалося розпізнати номер. Введіть його у форматі +380981234567.", PHONE_MARKUP)
+                return True
+            self.store.set(chat_id, STATE_CONTACT, dict(data, phone=normalized))
+            # Повідомлення несе одну клавіатуру: спершу прибираємо клавіатуру телефону, потім — inline-вибір
+            self.send(chat_id, f"Телефон: {normalized}", REMOVE_KEYBOARD)
+            self.send(chat_id, "Як Вам зручніше отримати відповідь?", CONTACT_MARKUP)
+        elif state == STATE_CONTACT:
+            self.send(chat_id, "Оберіть спосіб зв'язку кнопкою нижче:", CONTACT_MARKUP)
+        return True
@@ -0,0 +1,145 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+
+# Поля контексту поточного оновлення (update_id, chat_id), що додаються до кожного запису
+log_context = contextvars.ContextVar("log_context", default=None)
+CONTEXT_FIELDS = ("update_id", "chat_id", "latency_ms")
+
+
+def bind_context(**fields):
+    return log_context.set(fields)
+
+
+def reset_context(token):
+    log_context.reset(token)
+
+
+# Додає поля контексту до запису в потоці, де він створений (до постановки в чергу)
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        context = log_context.get()
+        if context:
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+
+# Пропускає лише частку записів рівня INFO і нижче; попередження та помилки не відкидаються
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+# Черга обмежена: якщо listener не встигає, записи відкидаються, а не блокують обробник.
+# Потік listener запускається з першим записом у кожному процесі: потоки не переживають fork(),
+# тож дочірній процес (воркер gunicorn) отримує нову чергу й власний listener
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, queue_size, handlers):
+        super().__init__(queue.Queue(queue_size))
+        self.queue_size = queue_size
+        self.targets = handlers
+        self.dropped = 0
+        self._listener = None
+        self._listener_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self.queue = queue.Queue(self.queue_size)
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = logging.handlers.QueueListener(self.queue, *self.targets, respect_handler_level=True)
+                self._listener.start()
+
+    def stop(self):
+        with self._listener_lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+
+    def prepare(self, record):
+        # Черга в межах процесу, тож форматування (%-підстановка) відкладається до потоку listener
+        return record
+
+    def enqueue(self, record):
+        if self._listener is None:
+            self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def parse_sample_rates(spec):
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+# Налаштування логування: обробники запису (файл з ротацією, консоль) працюють у потоці QueueListener,
+# а в потоці обробника оновлення лише кладемо запис у чергу
+def setup_logging(level="INFO", log_file="bot.log", max_bytes=5 * 1024 * 1024, backup_count=5,
+                  rotate_when=None, json_format=False, sample_rates=None, queue_size=10000):
+    if json_format:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        if rotate_when:
+            handlers.append(logging.handlers.TimedRotatingFileHandler(
+                log_file, when=rotate_when, backupCount=backup_count, encoding="utf-8"))
+        else:
+            handlers.append(logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(queue_size, handlers)
+    queue_handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    for name, rate in (sample_rates or {}).items():
+        logging.getLogger(name).addFilter(SamplingFilter(rate))
+
+    atexit.register(queue_handler.stop)
+    return queue_handler
@@ -1,439 +1,744 @@
+import time
+IMPORT_STARTED = time.perf_counter()  # Для звіту про старт (див. StartupReport)
 import telebot
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 import os
 import logging
-import time
-import asyncio
-import requests
-from telebot.handler_backends import BaseMiddleware
-from telebot import types
-from flask import Flask
+import random
+import hmac
+from telebot.handler_backends import BaseMiddleware, CancelUpdate
+from telebot import types, apihelper
 import threading
-
-# Налаштування логування
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("bot.log"),
-        logging.StreamHandler()
-    ]
+import atexit
+from screens import ScreenRegistry
+from outbox import SendScheduler
+from subscribers import SubscriberStore, Broadcaster, format_counts
+from ratelimit import TokenBucketLimiter, MemoryBucketStore, SQLiteBucketStore
+from telebot.apihelper import ApiTelegramException
+import metrics
+from dispatcher import PartitionedDispatcher
+from offsets import UpdateJournal
+from leads import ConversationStore, LeadForwarder, LeadFlow, TARIFFS, CALLBACKS as LEAD_CALLBACKS
+from search import TariffIndex
+from routing import UpdateRouter, observe_handler
+from rendercache import RenderCache, render_fingerprint, is_not_modified
+from logsetup import setup_logging, parse_sample_rates, bind_context, reset_context
+from startup import StartupReport
+from analytics import FunnelStats, format_funnel
+from httpclient import create_session, connection_stats, KeepAlivePinger
+
+# Налаштування логування: запис у файл/консоль виконується у фоновому потоці.
+# LOG_ROTATE_WHEN (наприклад, midnight) вмикає ротацію за часом замість ротації за розміром,
+# LOG_SAMPLE — частка INFO-записів, що залишаються, для окремих логерів: "__main__=0.1,outbox=0.5"
+setup_logging(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    log_file=os.getenv("LOG_FILE", "bot.log"),
+    max_bytes=int(os.getenv("LOG_MAX_BYTES", 5 * 1024 * 1024)),
+    backup_count=int(os.getenv("LOG_BACKUP_COUNT", 5)),
+    rotate_when=os.getenv("LOG_ROTATE_WHEN"),
+    json_format=os.getenv("LOG_JSON", "0") == "1",
+    sample_rates=parse_sample_rates(os.getenv("LOG_SAMPLE", ""))
 )
 logger = logging.getLogger(__name__)
 
 logger.info("Початок виконання скрипта")
 
-# Ініціалізація Flask для health-check
-app = Flask(__name__)
-
 # Налаштування Telegram бота
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 KEEP_ALIVE_URL = os.getenv("RENDER_EXTERNAL_URL")  # Наприклад, https://telegram-bot-roc.onrender.com
+# Інша адреса Bot API (власний telegram-bot-api сервер або bench.fake_api), формат http://host:port/bot{0}/{1}
+if os.getenv("BOT_API_URL"):
+    apihelper.API_URL = os.getenv("BOT_API_URL")
+
+# Режим отримання оновлень: polling (long-poll) або webhook (через Flask/gunicorn)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", KEEP_ALIVE_URL)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Лише A-Z, a-z, 0-9, _ та -
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))
+# Диспетчер оновлень: кількість потоків-обробників і розмір черги кожного з них
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", 4))
+DISPATCH_QUEUE_SIZE = int(os.getenv("DISPATCH_QUEUE_SIZE", 100))
+ALLOWED_UPDATES = ["message", "callback_query", "inline_query"]
+# Inline-запити не обмежуються: повторні відповіді Telegram бере зі свого кешу
+RATE_LIMITED_UPDATES = ["message", "callback_query"]
+# Inline-пошук тарифів (@bot фоп 3); inline-режим вмикається в @BotFather (/setinline).
+# BOT_USERNAME — для кнопки «Відкрити бота» у надісланій картці тарифу
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", 300))
+BOT_USERNAME = os.getenv("BOT_USERNAME")
+
+# Контент екранів (тексти тарифів, кнопки) і період перевірки змін файлу, сек (0 — вимкнено)
+SCREENS_FILE = os.getenv("SCREENS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "content", "screens.json"))
+SCREENS_RELOAD_INTERVAL = float(os.getenv("SCREENS_RELOAD_INTERVAL", 5))
+
+# Рушій обробки: sync (TeleBot + requests) або async (AsyncTeleBot + спільна aiohttp-сесія).
+# ASYNC_CONCURRENCY — максимум одночасних обробників, ASYNC_CONNECTION_LIMIT — розмір пулу з'єднань
+BOT_ENGINE = os.getenv("BOT_ENGINE", "sync").lower()
+ASYNC_CONCURRENCY = int(os.getenv("ASYNC_CONCURRENCY", 50))
+ASYNC_CONNECTION_LIMIT = int(os.getenv("ASYNC_CONNECTION_LIMIT", 50))
+
+# Rate limit: швидкість поповнення (токенів/сек) і розмір «пачки» для кожного типу оновлень.
+# RATE_LIMIT_DB — шлях до SQLite для спільних лімітів між воркерами (порожньо — у пам'яті процесу)
+RATE_LIMIT_MESSAGE_RATE = float(os.getenv("RATE_LIMIT_MESSAGE_RATE", 1))
+RATE_LIMIT_MESSAGE_BURST = int(os.getenv("RATE_LIMIT_MESSAGE_BURST", 5))
+RATE_LIMIT_CALLBACK_RATE = float(os.getenv("RATE_LIMIT_CALLBACK_RATE", 2))
+RATE_LIMIT_CALLBACK_BURST = int(os.getenv("RATE_LIMIT_CALLBACK_BURST", 6))
+RATE_LIMIT_MAX_ENTRIES = int(os.getenv("RATE_LIMIT_MAX_ENTRIES", 10000))
+RATE_LIMIT_TTL = float(os.getenv("RATE_LIMIT_TTL", 600))
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB")
+
+# Черга вихідних повідомлень: глобальний ліміт (повідомлень/сек), пауза між новими повідомленнями
+# в один чат (сек), кількість потоків, що паралельно виконують запити
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", 30))
+OUTBOX_PER_CHAT_INTERVAL = float(os.getenv("OUTBOX_PER_CHAT_INTERVAL", 1))
+OUTBOX_MAX_QUEUE = int(os.getenv("OUTBOX_MAX_QUEUE", 10000))
+OUTBOX_SENDERS = int(os.getenv("OUTBOX_SENDERS", 8))
+
+# HTTP-клієнт синхронного рушія: розмір пулу з'єднань (≥ кількості потоків, що звертаються до API),
+# тайм-аути з'єднання/читання (сек; для getUpdates telebot додає до long-poll тайм-ауту),
+# кількість повторів і коефіцієнт затримки між ними; період keep-alive пінгу (0 — вимкнено)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", DISPATCH_WORKERS + OUTBOX_SENDERS + 4))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 30))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", 0.5))
+KEEP_ALIVE_INTERVAL = float(os.getenv("KEEP_ALIVE_INTERVAL", 600))
+
+# База підписників, розсилок і заявок; ADMIN_IDS — id адміністраторів через кому,
+# LEADS_CHAT_ID — чат, куди пересилаються заявки на консультацію
+BOT_DB = os.getenv("BOT_DB", "bot.db")
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x}
+LEADS_CHAT_ID = int(os.getenv("LEADS_CHAT_ID")) if os.getenv("LEADS_CHAT_ID") else None
+LEAD_TTL = float(os.getenv("LEAD_TTL", 1800))  # Незавершена заявка скидається через 30 хв
+LEAD_FORWARD_INTERVAL = float(os.getenv("LEAD_FORWARD_INTERVAL", 30))
+# Аналітика воронки: як часто лічильники додаються у зведення (сек) і скільки днів зберігати погодинні дані
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", 60))
+ANALYTICS_HOURLY_RETENTION_DAYS = int(os.getenv("ANALYTICS_HOURLY_RETENTION_DAYS", 35))
+SUBSCRIBERS_FLUSH_INTERVAL = float(os.getenv("SUBSCRIBERS_FLUSH_INTERVAL", 5))
+BROADCAST_CHUNK = int(os.getenv("BROADCAST_CHUNK", 200))
+
+# Журнал останнього обробленого update_id (старіший за MAX_AGE_DAYS ігнорується), розмір буфера
+# для відсіювання повторів та затримки перезапуску polling (експоненційні, від BASE до MAX сек)
+OFFSET_JOURNAL = os.getenv("OFFSET_JOURNAL", "bot.offset")
+OFFSET_JOURNAL_MAX_AGE_DAYS = float(os.getenv("OFFSET_JOURNAL_MAX_AGE_DAYS", 7))
+DEDUP_SIZE = int(os.getenv("DEDUP_SIZE", 10000))
+POLLING_BACKOFF_BASE = float(os.getenv("POLLING_BACKOFF_BASE", 1))
+POLLING_BACKOFF_MAX = float(os.getenv("POLLING_BACKOFF_MAX", 60))
+POLLING_DUPLICATE_PAUSE = 0.5
+
+# Кількість повідомлень, для яких пам'ятаємо останній показаний вміст.
+# Кеш — у пам'яті процесу: з кількома воркерами gunicorn (WEB_CONCURRENCY > 1) натискання одного чату
+# обробляють різні процеси, і кеш одного не знає про редагування іншого. Тому за замовчуванням
+# пропуск редагувань тоді вимкнено (розмір 0)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", 10000 if WEB_CONCURRENCY <= 1 else 0))
+
+# Скільки секунд без завершеного getUpdates вважається зупинкою polling
+HEALTH_POLL_STALL = float(os.getenv("HEALTH_POLL_STALL", 90))
 
 # Перевірка змінних оточення
 if not BOT_TOKEN:
     logger.error("BOT_TOKEN не встановлено. Перевірте змінні оточення.")
     raise ValueError("BOT_TOKEN не встановлено")
 
+if BOT_MODE not in ("polling", "webhook"):
+    logger.error("Невідомий BOT_MODE: %s", BOT_MODE)
+    raise ValueError("BOT_MODE має бути polling або webhook")
+
+if BOT_ENGINE not in ("sync", "async"):
+    logger.error("Невідомий BOT_ENGINE: %s", BOT_ENGINE)
+    raise ValueError("BOT_ENGINE має бути sync або async")
+
+if BOT_ENGINE == "async" and BOT_MODE != "polling":
+    logger.error("Асинхронний рушій підтримує лише режим polling.")
+    raise ValueError("BOT_ENGINE=async потребує BOT_MODE=polling")
+
+if BOT_MODE == "webhook" and not (WEBHOOK_URL and WEBHOOK_SECRET):
+    logger.error("Для режиму webhook потрібні WEBHOOK_URL (або RENDER_EXTERNAL_URL) та WEBHOOK_SECRET.")
+    raise ValueError("WEBHOOK_URL або WEBHOOK_SECRET не встановлено")
+
+# TeleBot із вимірюванням часу та кодів помилок запитів до Bot API.
+# Отримані оновлення передаються в диспетчер замість обробки в потоці polling
+class InstrumentedTeleBot(telebot.TeleBot):
+    dispatcher = None
+    journal = None
+
+    # telebot бере offset для наступного getUpdates з last_update_id.
+    # З журналом підтверджуємо Telegram усі прийняті оновлення (див. UpdateJournal.acknowledged)
+    @property
+    def last_update_id(self):
+        if self.journal is not None:
+            return self.journal.acknowledged
+        return self._last_update_id
+
+    @last_update_id.setter
+    def last_update_id(self, value):
+        self._last_update_id = value
+
+    def process_new_updates(self, updates):
+        if self.dispatcher is None:
+            return super().process_new_updates(updates)
+        accepted = 0
+        for update in updates:
+            if self.journal is not None and not self.journal.accept(update.update_id):
+                metrics.duplicate_updates_total.inc()
+                continue
+            if self.journal is None and update.update_id > self._last_update_id:
+                self._last_update_id = update.update_id
+            # Блокуємося, доки в черзі чату немає місця: polling не забирає нові оновлення
+            self.dispatcher.submit(update)
+            accepted += 1
+        if updates and not accepted:
+            # Повторна доставка вже прийнятих оновлень (рідко, напр. після перезапуску) — не крутимо цикл
+            time.sleep(POLLING_DUPLICATE_PAUSE)
+
+    def process_updates_now(self, updates):
+        super().process_new_updates(updates)
+
+    def _timed(self, method, call, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return call(*args, **kwargs)
+        except ApiTelegramException as e:
+            metrics.api_errors_total.inc(method, str(e.error_code))
+            raise
+        except Exception:
+            metrics.api_errors_total.inc(method, "network")
+            raise
+        finally:
+            metrics.api_latency.observe(time.perf_counter() - started, method)
+
+    def send_message(self, *args, **kwargs):
+        return self._timed("send_message", super().send_message, *args, **kwargs)
+
+    def edit_message_text(self, *args, **kwargs):
+        return self._timed("edit_message_text", super().edit_message_text, *args, **kwargs)
+
+    def answer_callback_query(self, *args, **kwargs):
+        return self._timed("answer_callback_query", super().answer_callback_query, *args, **kwargs)
+
+    # Тривалість long-poll не показова, тому фіксуємо лише факт завершення getUpdates
+    def get_updates(self, *args, **kwargs):
+        try:
+            result = super().get_updates(*args, **kwargs)
+        except ApiTelegramException as e:
+            metrics.api_errors_total.inc("get_updates", str(e.error_code))
+            raise
+        except Exception:
+            metrics.api_errors_total.inc("get_updates", "network")
+            raise
+        metrics.poll_completed()
+        return result
+
+# Усі запити telebot (з усіх потоків) і keep-alive йдуть через одну сесію з пулом keep-alive з'єднань
+http_session = create_session(pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES, backoff=HTTP_RETRY_BACKOFF)
+apihelper.session = http_session
+apihelper.CONNECT_TIMEOUT = HTTP_CONNECT_TIMEOUT
+apihelper.READ_TIMEOUT = HTTP_READ_TIMEOUT
+metrics.registry.gauge("bot_http_connections_opened", "Відкрито HTTP-з'єднань (TLS-рукостискань)", lambda: connection_stats(http_session)[0])
+metrics.registry.gauge("bot_http_requests_sent", "Виконано HTTP-запитів через пул з'єднань", lambda: connection_stats(http_session)[1])
+
 try:
-    bot = telebot.TeleBot(BOT_TOKEN, use_class_middlewares=True)
+    # Оновлення обробляє PartitionedDispatcher (а в асинхронному рушії — AsyncTeleBot),
+    # тому внутрішній пул потоків telebot не потрібен
+    bot = InstrumentedTeleBot(BOT_TOKEN, use_class_middlewares=True, threaded=False)
     logger.info("Бот ініціалізовано")
 except Exception as e:
-    logger.error(f"Помилка ініціалізації бота: {e}")
+    logger.error("Помилка ініціалізації бота: %s", e)
     raise
 
-# Health-check ендпоінт для UptimeRobot
-@app.route('/health')
+# Реєстр екранів завантажується при старті (load_content); помилки контенту зупиняють запуск
+screens = ScreenRegistry(SCREENS_FILE, extra_callbacks=LEAD_CALLBACKS)
+tariff_index = TariffIndex(TARIFFS, bot_username=BOT_USERNAME)
+screens.add_listener(tariff_index.rebuild)
+
+# Усі send_message / edit_message_text проходять через планувальник з урахуванням flood-лімітів
+outbox = SendScheduler(
+    bot,
+    global_rate=OUTBOX_GLOBAL_RATE,
+    per_chat_interval=OUTBOX_PER_CHAT_INTERVAL,
+    max_queue=OUTBOX_MAX_QUEUE,
+    senders=OUTBOX_SENDERS
+)
+
+render_cache = RenderCache(RENDER_CACHE_SIZE)
+
+# Відправка простого тексту (без Markdown — у заявках є введений користувачем текст)
+def send_text(chat_id, text, reply_markup=None):
+    return outbox.submit("send_message", chat_id, text=text, reply_markup=reply_markup)
+
+# Заявки на консультацію: стан розмови в пам'яті з фоновим записом у SQLite (з кількома воркерами
+# gunicorn — одразу в SQLite, спільній для воркерів); завершені заявки пересилаються в LEADS_CHAT_ID пачками
+conversations = ConversationStore(BOT_DB, ttl=LEAD_TTL, shared=WEB_CONCURRENCY > 1)
+atexit.register(conversations.flush)
+lead_forwarder = LeadForwarder(BOT_DB, outbox, LEADS_CHAT_ID, interval=LEAD_FORWARD_INTERVAL)
+lead_flow = LeadFlow(conversations, lead_forwarder, send_text)
+
+# Підписники записуються пачками у фоні; розсилка читає їх порціями й відправляє через outbox
+subscribers = SubscriberStore(BOT_DB, flush_interval=SUBSCRIBERS_FLUSH_INTERVAL)
+atexit.register(subscribers.flush)
+broadcaster = Broadcaster(
+    BOT_DB,
+    subscribers,
+    outbox,
+    notify=lambda chat_id, text: outbox.submit("send_message", chat_id, text=text),
+    chunk_size=BROADCAST_CHUNK
+)
+
+# Переходи між екранами рахуються в пам'яті й періодично записуються у зведення (/stats)
+funnel = FunnelStats(BOT_DB, flush_interval=ANALYTICS_FLUSH_INTERVAL, retention_days=ANALYTICS_HOURLY_RETENTION_DAYS)
+atexit.register(funnel.flush)
+
+metrics.registry.gauge("bot_outbox_depth", "Запити в черзі відправки", outbox.depth)
+
+# Health-check: liveness/readiness на основі метрик.
+# polling — getUpdates мав завершитися не пізніше HEALTH_POLL_STALL сек тому (long-poll триває до 20 сек);
+# webhook — пул обробки оновлень не переповнений
 def health():
+    now = time.time()
+    status = "ok"
+    if BOT_MODE == "polling":
+        if now - (metrics.last_poll_at or metrics.started_at) > HEALTH_POLL_STALL:
+            status = "stalled"
+    elif dispatcher.saturated():
+        status = "busy"
+    body = {
+        "status": status,
+        "mode": BOT_MODE,
+        "seconds_since_last_update": None if metrics.last_update_at is None else round(now - metrics.last_update_at, 1),
+        "seconds_since_last_poll": None if metrics.last_poll_at is None else round(now - metrics.last_poll_at, 1),
+        "outbox_depth": outbox.depth()
+    }
+    return body, 200 if status == "ok" else 503
+
+def metrics_endpoint():
+    return metrics.registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+# Чат, до якого належить оновлення (для логів і розподілу навантаження)
+def update_chat_id(update):
+    if update.message is not None:
+        return update.message.chat.id
+    if update.callback_query is not None:
+        return update.callback_query.from_user.id
+    if update.inline_query is not None:
+        return update.inline_query.from_user.id
+    return None
+
+# Обробка одного оновлення в потоці диспетчера (з контекстом для логів)
+def process_update(update):
+    token = bind_context(update_id=update.update_id, chat_id=update_chat_id(update))
+    try:
+        bot.process_updates_now([update])
+    finally:
+        journal.done(update.update_id)
+        reset_context(token)
+
+# Диспетчер зберігає порядок оновлень у межах чату й обробляє різні чати паралельно.
+# Через нього проходять оновлення і з polling, і з webhook.
+dispatcher = PartitionedDispatcher(process_update, update_chat_id, workers=DISPATCH_WORKERS, queue_size=DISPATCH_QUEUE_SIZE)
+bot.dispatcher = dispatcher
+
+# Журнал offset зберігається на диск лише в режимі polling (один процес, обидва рушії);
+# у режимі webhook кожен воркер лише відкидає повторні доставки
+journal = UpdateJournal(
+    OFFSET_JOURNAL if BOT_MODE == "polling" else None,
+    dedup_size=DEDUP_SIZE,
+    max_age=OFFSET_JOURNAL_MAX_AGE_DAYS * 86400
+)
+bot.journal = journal
+atexit.register(journal.flush)
+metrics.registry.gauge("bot_dispatch_queue_depth", "Оновлення в чергах диспетчера", dispatcher.depth)
+
+# Ендпоінт для прийому оновлень від Telegram у режимі webhook
+def webhook(secret):
+    from flask import request, abort
+    if BOT_MODE != "webhook":
+        abort(404)
+    header_secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not (hmac.compare_digest(secret, WEBHOOK_SECRET) and hmac.compare_digest(header_secret, WEBHOOK_SECRET)):
+        logger.warning("Webhook: невірний секретний токен")
+        abort(403)
+    try:
+        update = types.Update.de_json(request.get_data(as_text=True))
+    except Exception as e:
+        logger.error("Webhook: не вдалося розібрати оновлення: %s", e)
+        abort(400)
+    if update is None:
+        abort(400)
+    if not journal.accept(update.update_id):
+        metrics.duplicate_updates_total.inc()
+        return {"status": "duplicate"}, 200
+    # Якщо черга чату переповнена, повертаємо 503 — Telegram повторить доставку пізніше
+    if not dispatcher.submit(update, block=False):
+        journal.forget(update.update_id)
+        logger.warning("Webhook: черга переповнена, оновлення %s відхилено", update.update_id)
+        return {"status": "busy"}, 503
     return {"status": "ok"}, 200
 
-# Middleware для обмеження частоти запитів
-class RateLimitMiddleware(BaseMiddleware):
+# Flask (разом із werkzeug і jinja2 — найважчий імпорт) потрібен лише для HTTP-ендпоінтів,
+# тому застосунок створюється на вимогу; gunicorn викликає create_app() як фабрику (див. Procfile)
+_app = None
+_app_lock = threading.Lock()
+
+def create_app():
+    global _app
+    with _app_lock:
+        if _app is None:
+            from flask import Flask
+            app = Flask(__name__)
+            app.add_url_rule('/health', view_func=health)  # Health-check для UptimeRobot
+            app.add_url_rule('/metrics', view_func=metrics_endpoint)
+            app.add_url_rule('/webhook/<secret>', view_func=webhook, methods=['POST'])
+            _app = app
+    return _app
+
+# Реєстрація webhook у Telegram (викликається один раз при старті)
+def setup_webhook():
+    url = f"{WEBHOOK_URL.rstrip('/')}/webhook/{WEBHOOK_SECRET}"
+    bot.set_webhook(
+        url=url,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=ALLOWED_UPDATES
+    )
+    logger.info("Webhook встановлено: %s/webhook/***", WEBHOOK_URL.rstrip('/'))
+
+# Middleware для підрахунку оновлень (реєструється першим, щоб бачити й відкинуті rate limiter)
+class MetricsMiddleware(BaseMiddleware):
     def __init__(self):
-        self.last_request = {}
+        super().__init__()
+        self.update_types = ALLOWED_UPDATES
 
     def pre_process(self, message, data):
-        chat_id = message.chat.id if isinstance(message, types.Message) else message.from_user.id
-        current_time = time.time()
-        if chat_id in self.last_request:
-            if current_time - self.last_request[chat_id] < 0.5:  # Обмеження: 0.5 сек
-                return None  # Пропускаємо запит
-        self.last_request[chat_id] = current_time
-        return data
+        if isinstance(message, types.CallbackQuery):
+            kind = "callback_query"
+        elif isinstance(message, types.InlineQuery):
+            kind = "inline_query"
+        else:
+            kind = "message"
+        metrics.update_received(kind)
 
     def post_process(self, message, data, exception):
         pass
 
-bot.setup_middleware(RateLimitMiddleware())
+# Middleware для обмеження частоти запитів (token bucket на кожен чат і тип оновлення)
+class RateLimitMiddleware(BaseMiddleware):
+    def __init__(self, limiter):
+        super().__init__()
+        self.update_types = RATE_LIMITED_UPDATES
+        self.limiter = limiter
 
-# Функція для "пінгування" сервера
-def keep_alive():
-    if KEEP_ALIVE_URL:
-        try:
-            response = requests.get(KEEP_ALIVE_URL + "/health")
-            logger.info(f"Keep-alive ping: {response.status_code}")
-        except Exception as e:
-            logger.error(f"Помилка keep-alive: {e}")
-
-# Функція головного меню
-def send_main_menu(chat_id):
-    welcome_text = (
-        "Вас вітає\n"
-        "*Reliable Outsorsing Company* –\n"
-        "бухгалтерська аутсорсингова компанія"
-    )
-    markup = InlineKeyboardMarkup(row_width=1)
-    markup.add(
-        InlineKeyboardButton("📋 Ціни", callback_data="prices"),
-        InlineKeyboardButton("📲 Instagram", url="https://www.instagram.com/reliable_outsorsing_company/"),
-        InlineKeyboardButton("💼 Контакти", callback_data="contacts"),
-        InlineKeyboardButton("👤 Про компанію", callback_data="about")
+    def pre_process(self, message, data):
+        if isinstance(message, types.CallbackQuery):
+            kind, chat_id = "callback_query", message.from_user.id
+        else:
+            kind, chat_id = "message", message.chat.id
+        if self.limiter.allow(kind, chat_id):
+            return None
+        logger.info("Rate limit: пропущено %s від %s", kind, chat_id)
+        metrics.rate_limited_total.inc(kind)
+        if kind == "callback_query":
+            # Прибираємо «годинник» на кнопці, щоб клієнт не чекав відповіді
+            try:
+                bot.answer_callback_query(message.id)
+            except Exception as e:
+                logger.error("Помилка відповіді на пропущений callback: %s", e)
+        return CancelUpdate()
+
+    def post_process(self, message, data, exception):
+        pass
+
+def create_rate_limiter():
+    if RATE_LIMIT_DB:
+        store = SQLiteBucketStore(RATE_LIMIT_DB, max_entries=RATE_LIMIT_MAX_ENTRIES, ttl=RATE_LIMIT_TTL)
+    else:
+        store = MemoryBucketStore(max_entries=RATE_LIMIT_MAX_ENTRIES, ttl=RATE_LIMIT_TTL)
+    return TokenBucketLimiter(store, {
+        "message": (RATE_LIMIT_MESSAGE_RATE, RATE_LIMIT_MESSAGE_BURST),
+        "callback_query": (RATE_LIMIT_CALLBACK_RATE, RATE_LIMIT_CALLBACK_BURST),
+    })
+
+bot.setup_middleware(MetricsMiddleware())
+bot.setup_middleware(RateLimitMiddleware(create_rate_limiter()))
+
+# "Пінгування" сервера у фоні (лише в режимі polling — у webhook-режимі вхідні запити надходять від Telegram)
+keep_alive = KeepAlivePinger(
+    http_session,
+    KEEP_ALIVE_URL + "/health" if KEEP_ALIVE_URL else None,
+    interval=KEEP_ALIVE_INTERVAL,
+    timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+)
+
+# Відправка екрана новим повідомленням (через чергу відправки)
+def send_screen(chat_id, screen):
+    future = outbox.submit(
+        "send_message",
+        chat_id,
+        text=screen.text,
+        reply_markup=screen.reply_markup,
+        parse_mode=screen.parse_mode,
+        disable_web_page_preview=screen.disable_web_page_preview
     )
+    fingerprint = render_fingerprint(screen.text, screen.reply_markup)
+
+    def remember(f):
+        if f.exception() is None:
+            render_cache.put(chat_id, f.result().message_id, fingerprint)
+
+    future.add_done_callback(remember)
+    return future
+
+# Заміна поточного повідомлення на вміст екрана (через чергу відправки).
+# Якщо повідомлення вже показує цей вміст, редагування пропускається
+def edit_screen(chat_id, message_id, screen):
+    fingerprint = render_fingerprint(screen.text, screen.reply_markup)
+    if render_cache.get(chat_id, message_id) == fingerprint:
+        metrics.edits_skipped_total.inc()
+        return None
+    # Запам'ятовуємо одразу: наступне натискання порівнюється з тим, що буде показано після черги.
+    # Якщо черга запит не прийняла, повідомлення не зміниться — відбиток прибираємо
+    render_cache.put(chat_id, message_id, fingerprint)
     try:
-        bot.send_message(chat_id, welcome_text, reply_markup=markup, parse_mode="Markdown")
-        logger.info(f"Відправлено головне меню для chat_id: {chat_id}")
-    except Exception as e:
-        logger.error(f"Помилка відправки головного меню: {e}")
+        future = outbox.submit(
+            "edit_message_text",
+            chat_id,
+            text=screen.text,
+            message_id=message_id,
+            reply_markup=screen.reply_markup,
+            parse_mode=screen.parse_mode,
+            disable_web_page_preview=screen.disable_web_page_preview
+        )
+    except Exception:
+        render_cache.discard(chat_id, message_id, fingerprint)
+        raise
+
+    def forget_on_error(f):
+        error = f.exception()
+        if error is not None and not is_not_modified(error):
+            render_cache.discard(chat_id, message_id, fingerprint)
+
+    future.add_done_callback(forget_on_error)
+    return future
+
+# Логіка обробників, спільна з асинхронним рушієм (облік, пошук екрана, заявка)
+router = UpdateRouter(screens, send_screen, edit_screen, subscribers, funnel, lead_flow)
 
 # Обробник /start
 @bot.message_handler(commands=['start'])
 def handle_start(message):
-    logger.info(f"Отримано команду /start від {message.chat.id}")
-    send_main_menu(message.chat.id)
+    started = time.perf_counter()
+    logger.info("Отримано команду /start від %s", message.chat.id)
+    router.start(message.chat.id)
+    observe_handler("start", started, message.chat.id, "/start оброблено")
+
+def is_admin(message):
+    return message.from_user.id in ADMIN_IDS
+
+# Розсилка для адміністраторів: /broadcast <текст> запускає, /broadcast без тексту показує прогрес
+@bot.message_handler(commands=['broadcast'], func=is_admin)
+def handle_broadcast(message):
+    chat_id = message.chat.id
+    text = message.text.partition(" ")[2].strip()
+    try:
+        if text:
+            broadcast_id = broadcaster.create(text, chat_id)
+            logger.info("Розсилку #%s створено адміністратором %s", broadcast_id, message.from_user.id)
+            reply = f"Розсилку #{broadcast_id} запущено, активних підписників: {subscribers.count()}"
+        else:
+            broadcast_id = broadcaster.last_id()
+            progress = broadcaster.progress(broadcast_id) if broadcast_id else None
+            if progress is None:
+                reply = "Розсилок ще не було. Використання: /broadcast <текст>"
+            else:
+                status, counts = progress
+                reply = f"Розсилка #{broadcast_id} ({status}): {format_counts(counts)}"
+        outbox.submit("send_message", chat_id, text=reply)
+    except Exception as e:
+        logger.error("Помилка команди /broadcast: %s", e)
+
+# Аналітика для адміністраторів (лише зі зведень): /stats [днів] — воронка,
+# /stats csv [днів] [hourly] — вивантаження у CSV
+@bot.message_handler(commands=['stats'], func=is_admin)
+def handle_stats(message):
+    chat_id = message.chat.id
+    args = message.text.split()[1:]
+    export = bool(args) and args[0] == "csv"
+    if export:
+        args = args[1:]
+    hourly = "hourly" in args
+    days = next((int(arg) for arg in args if arg.isdigit() and int(arg) > 0), 30 if export else 7)
+    try:
+        if export:
+            outbox.submit(
+                "send_document",
+                chat_id,
+                document=funnel.export_csv(days, hourly=hourly),
+                visible_file_name=f"funnel_{'hourly' if hourly else 'daily'}_{days}d.csv"
+            )
+        else:
+            views, onward = funnel.summary(days)
+            outbox.submit("send_message", chat_id, text=format_funnel(views, onward, days))
+    except Exception as e:
+        logger.error("Помилка команди /stats: %s", e)
+
+# Відповіді в сценарії заявки (ім'я, телефон текстом або кнопкою «поділитися контактом»)
+@bot.message_handler(func=lambda message: router.lead_active(message.chat.id), content_types=['text', 'contact'])
+def handle_lead_message(message):
+    phone = message.contact.phone_number if message.contact else None
+    router.lead_message(message.chat.id, message.text, phone)
 
-# Обробник callback-запитів
+# Обробник callback-запитів: пошук екрана в реєстрі за call.data
 @bot.callback_query_handler(func=lambda call: True)
 def handle_query(call):
+    started = time.perf_counter()
     chat_id = call.message.chat.id
     message_id = call.message.message_id
-    logger.info(f"Отримано callback: {call.data} від {chat_id}")
-
-    def tpl_back():
-        return InlineKeyboardMarkup(row_width=1).add(
-            InlineKeyboardButton("💼 Наші контакти", callback_data="contacts"),
-            InlineKeyboardButton("🔙 Повернутися до попереднього меню", callback_data="prices")
-        )
+    logger.info("Отримано callback: %s від %s", call.data, chat_id)
 
     try:
-        if call.data == "prices":
-            text = (
-                "💼 *Тарифи на бухгалтерське обслуговування ФОП*\n"
-                "🧾 Кожен тариф включає базові послуги: підготовку звітності, контроль платежів, консультації та перевірку електронного кабінету.\n"
-                "👇 Оберіть потрібний тариф нижче:"
-            )
-            markup = InlineKeyboardMarkup(row_width=1)
-            markup.add(
-                InlineKeyboardButton("1️⃣ ФОП 1 група — від 400 грн/міс", callback_data="fop1"),
-                InlineKeyboardButton("2️⃣ ФОП 2 група — від 400 грн/міс", callback_data="fop2"),
-                InlineKeyboardButton("3️⃣ ФОП 3 група (без ПДВ) — від 400 грн/міс", callback_data="fop3nopdv"),
-                InlineKeyboardButton("3️⃣ ФОП 3 група (з ПДВ) — від 3500 грн/міс", callback_data="fop3pdv"),
-                InlineKeyboardButton("🧍‍♂️ ФОП з працівниками — від 2300 грн/міс", callback_data="fop_staff"),
-                InlineKeyboardButton("📑 ФОП на загальній системі — від 3500 грн/міс", callback_data="fop_general"),
-                InlineKeyboardButton("🏢 ТОВ/ПП — від 5000 грн/міс", callback_data="llc"),
-                InlineKeyboardButton("📝 Реєстрація ФОП — 1000 грн", callback_data="reg_fop"),
-                InlineKeyboardButton("❌ Закриття ФОП — 1500 грн", callback_data="close_fop"),
-                InlineKeyboardButton("📑 Декларація ФОП на ЄП — 1000 грн", callback_data="decl_fop"),
-                InlineKeyboardButton("🔙 Повернутися до головного меню", callback_data="main_menu")
-            )
-            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup, parse_mode="Markdown")
-
-        elif call.data == "fop1":
-            text = (
-                "👤 *ФОП 1 група (єдиний податок)*\n"
-                "*Базовий тариф:* 400 грн/міс\n\n"
-                "*Дозволена діяльність:*\n"
-                "• Продаж товарів із торгових місць на ринках\n"
-                "• Надання побутових послуг населенню\n"
-                "• Можливість працювати без використання РРО\n"
-                "• Без найманих працівників\n\n"
-                "*У тариф входить:*\n"
-                "✅ Розрахунок доходу та ведення Книги обліку\n"
-                "✅ Контроль ліміту доходу відповідно до групи\n"
-                "✅ Нагадування про сплату податків, формування реквізитів, контроль оплат\n"
-                "✅ Можливість здійснення оплат податків бухгалтером (за доступом)\n"
-                "✅ Щомісячний аудит електронного кабінету\n"
-                "✅ Подання податкової звітності, заяв, листів, запитів\n"
-                "✅ Відповіді на запитання в процесі супроводу\n\n"
-                "📌 *Додатково:* при використанні РРО та/або еквайрингу — +100 грн/міс"
-            )
-            markup = tpl_back()
-            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup, parse_mode="Markdown")
-
-        elif call.data == "fop2":
-            text = (
-                "👤 *ФОП 2 група (єдиний податок)*\n"
-                "*Базовий тариф:* 400 грн/міс\n\n"
-                "*Діяльність дозволена:*\n"
-                "• Продаж товарів будь‑кому\n"
-                "• Надання послуг населенню та платникам єдиного податку\n"
-                "• До 10 найманих працівників\n\n"
-                "*У тариф входить:*\n"
-                "✅ Розрахунок доходу та Книги обліку\n"
-                "✅ Контроль ліміту доходу\n"
-                "✅ Нагадування про сплату, формування реквізитів, контроль оплат\n"
-                "✅ Оплата податків бухгалтером (за доступом)\n"
-                "✅ Щомісячний аудит кабінету\n"
-                "✅ Подання звітності, заяв, листів, запитів\n"
-                "✅ Підтримка під час супроводу\n\n"
-                "📌 *Додатково:* при використанні РРО/еквайрингу — +200 грн/міс"
-            )
-            markup = tpl_back().add(InlineKeyboardButton("👥 Тариф із найманими працівниками", callback_data="fop_staff"))
-            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup, parse_mode="Markdown")
-
-        elif call.data == "fop3nopdv":
-            text = (
-                "👤 *ФОП 3 група (єдиний податок без ПДВ)*\n"
-                "*Базовий тариф:* 400 грн/міс\n\n"
-                "*Діяльність дозволена:*\n"
-                "• Продаж і послуги будь‑кому\n"
-                "• Необмежена кількість працівників\n\n"
-                "*У тариф входить:*\n"
-                "✅ Розрахунок доходу та Книги обліку\n"
-                "✅ Контроль ліміту доходу\n"
-                "✅ Нагадування, формування реквізитів, контроль оплат\n"
-                "✅ Оплата податків бухгалтером (за доступом)\n"
-                "✅ Щомісячний аудит кабінету\n"
-                "✅ Подання звітності, заяв, листів, запитів\n"
-                "✅ Підтримка супроводу\n\n"
-                "📌 *Додатково:* при РРО/еквайрингу — +200 грн/міс"
-            )
-            markup = tpl_back().add(InlineKeyboardButton("👥 Тариф із найманими працівниками", callback_data="fop_staff"))
-            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup, parse_mode="Markdown")
-
-        elif call.data == "fop3pdv":
-            text = (
-                "👤 *ФОП 3 група (єдиний податок з ПДВ)*\n"
-                "*Базовий тариф:* 3500 грн/міс\n\n"
-                "*Діяльність дозволена:*\n"
-                "• Продаж і послуги будь‑кому\n"
-                "• Необмежена кількість працівників\n\n"
-                "*У тариф входить:*\n"
-                "✅ Розрахунок доходу та Книги обліку\n"
-                "✅ Контроль ліміту доходу\n"
-                "✅ Нагадування, формування реквізитів, контроль оплат\n"
-                "✅ Оплата податків бухгалтером (за доступом)\n"
-                "✅ Щомісячний аудит кабінету\n"
-                "✅ Подання звітності, заяв, листів, запитів\n"
-                "✅ Підтримка супроводу\n\n"
-                "💰 *Блок ПДВ:*\n"
-                "✅ Рахунки‑накладні, акти (до 10/міс)\n"
-                "✅ Реєстрація в ЄРПН\n"
-                "✅ Контроль вхідних накладних\n"
-                "✅ Перевірка УКТ ЗЕД\n"
-                "✅ Моніторинг ліміту в СЕА ПДВ\n"
-                "✅ Подання декларації з ПДВ\n"
-                "✅ Контроль сплати податку\n\n"
-                "📌 *Вартість тарифу індивідуально — залежно від обсягу операцій та специфіки.*"
-            )
-            markup = tpl_back()
-            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup, parse_mode="Markdown")
-
-        elif call.data == "fop_staff":
-            text = (
-                "👤 *ФОП на єдиному податку (з найманими працівниками)*\n"
-                "*Базовий тариф:* 2300 грн/міс\n\n"
-                "*У тариф входить:*\n"
-                "✅ Розрахунок доходу та Книги обліку\n"
-                "✅ Контроль ліміту доходу\n"
-                "✅ Нагадування, формування реквізитів, контроль оплат\n"
-                "✅ Оплата податків бухгалтером (за доступом)\n"
-                "✅ Щомісячний аудит кабінету\n"
-                "✅ Подання звітності, заяв, листів, запитів\n"
-                "✅ Підтримка супроводу\n\n"
-                "👥 *Зарплатний блок:*\n"
-                "✅ Нарахування зарплати (до 3 працівників)\n"
-                "✅ Два рази на місяць виплати та податки\n"
-                "✅ Платіжні відомості (клієнт‑банк)\n"
-                "✅ Кадрові документи (накази)\n"
-                "✅ Відпустки, лікарняні, індексація\n"
-                "✅ Зарплатна звітність\n\n"
-                "📌 Кожен наступний працівник +100 грн/міс"
-            )
-            markup = tpl_back()
-            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup, parse_mode="Markdown")
-
-        elif call.data == "fop_general":
-            text = (
-                "👤 *ФОП на загальній системі*\n"
-                "*Базовий тариф:* 3500 грн/міс\n\n"
-                "*У тариф входить:*\n"
-                "✅ Розрахунок доходу та ведення Книги обліку доходів та витрат\n"
-                "✅ Ведення Форми обліку товарних запасів\n"
-                "✅ Контроль ліміту доходу 1 млн (для реєстрації платником ПДВ)\n"
-                "✅ Нагадування про сплату податків, формування реквізитів, контроль оплат\n"
-                "✅ Можливість здійснення оплат податків бухгалтером (за доступом)\n"
-                "✅ Щомісячний аудит електронного кабінету\n"
-                "✅ Подання податкової звітності, заяв, листів, запитів\n"
-                "✅ Розрахунок акцизного податку, подання Декларації з акцизного податку\n"
-                "✅ Відповіді на запитання в процесі супроводу\n\n"
-                "📌 *Додатково:* наявність найманих працівників — +1500 грн/міс"
-            )
-            markup = tpl_back()
-            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup, parse_mode="Markdown")
-
-        elif call.data == "llc":
-            text = (
-                "🏢 *ТОВ/ПП*\n"
-                "*Базовий тариф:* 5000 грн/міс\n\n"
-                "*У тариф входить:*\n"
-                "✅ Відображення операцій на рахунках бухгалтерського обліку\n"
-                "✅ Подання фінансової та податкової звітності, заяв, листів, запитів\n"
-                "✅ Контроль ліміту доходу 1 млн (для реєстрації платником ПДВ)\n"
-                "✅ Нагадування про сплату податків, формування реквізитів, контроль оплат\n"
-                "✅ Можливість здійснення оплат податків та контрагентам бухгалтером (за доступом)\n"
-                "✅ Щомісячний аудит електронного кабінету\n"
-                "✅ Нарахування та виплата заробітної плати\n"
-                "✅ Базові кадрові документи (Накази)\n"
-                "✅ Відповіді на запитання в процесі супроводу\n\n"
-                "📌 *Вартість тарифу розраховується індивідуально — залежно від*\n"
-                "• системи оподаткування (загальна/спрощена)\n"
-                "• статусу платника ПДВ\n"
-                "• виду діяльності\n"
-                "• обсягу операцій, кількості документів і- специфіки вашої діяльності, придбаного програмного забезпечення (MeDoc)\n"
-                "• кількості найманих працівників\n"
-                "• випадків блокування податкових накладних"
-            )
-            markup = tpl_back()
-            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup, parse_mode="Markdown")
-
-        elif call.data == "reg_fop":
-            text = (
-                "📝 *Реєстрація ФОП*\n"
-                "*Вартість:* 1000 грн\n\n"
-                "*У вартість входить:*\n"
-                "✅ Попередня консультація\n"
-                "✅ Вибір оптимальної системи оподаткування\n"
-                "✅ Підбір КВЕД під види діяльності\n"
-                "✅ Допомога із створенням електронного підпису\n"
-                "✅ Перевірка відсутності податкового боргу\n"
-                "✅ Подання заяви на реєстрацію ФОП\n"
-                "✅ Перевірка правильності поставлення ФОП на облік\n"
-                "✅ Виписка про реєстрацію ФОП та Витяг платника єдиного податку\n"
-                "✅ Подання Форми 20-ОПП\n"
-                "✅ Реєстрація ПРРО\n"
-                "✅ Допомога з відкриттям рахунку в банку\n"
-                "✅ Надання реквізитів для оплати податків"
-            )
-            markup = tpl_back()
-            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup, parse_mode="Markdown")
-
-        elif call.data == "close_fop":
-            text = (
-                "📝 *Закриття ФОП*\n"
-                "*Вартість:* 1500 грн\n\n"
-                "*У вартість входить:*\n"
-                "✅ Попередня консультація\n"
-                "✅ Розрахунок доходу\n"
-                "✅ Перевірка податкового кабінету\n"
-                "✅ Допомога із створенням електронного підпису\n"
-                "✅ Перевірка відсутності податкового боргу\n"
-                "✅ Подання заяви на закриття ФОП\n"
-                "✅ Виписка про закриття ФОП\n"
-                "✅ Подання ліквідаційної податкової декларації\n"
-                "✅ Подання Форми 20-ОПП на зняття об'єктів\n"
-                "✅ Скасування реєстрації ПРРО"
-            )
-            markup = tpl_back()
-            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup, parse_mode="Markdown")
-
-        elif call.data == "decl_fop":
-            text = (
-                "📑 *Декларація ФОП на ЄП*\n"
-                "*Вартість:* 1000 грн\n\n"
-                "*У вартість входить:*\n"
-                "✅ Розрахунок доходу\n"
-                "✅ Перевірка податкового кабінету\n"
-                "✅ Допомога із створенням електронного підпису\n"
-                "✅ Перевірка відсутності податкового боргу\n"
-                "✅ Подання податкової декларації"
-            )
-            markup = tpl_back()
-            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup, parse_mode="Markdown")
-
-        elif call.data == "contacts":
-            text = (
-                "📞 Зв’яжіться з нами у зручний спосіб:\n\n"
-                "📱 Телефон/Viber/Telegram: +38 (098) 159‑75‑70\n"
-                "✉️ Email: r.o.c@ukr.net\n"
-                "📲 [Instagram](https://www.instagram.com/reliable_outsorsing_company/)\n"
-                "💬 [Telegram](https://t.me/Reliable_Outsorsing_Company)\n"
-                "💬 [WhatsApp](https://wa.me/380981597570)"
-            )
-            markup = InlineKeyboardMarkup(row_width=1).add(
-                InlineKeyboardButton("🔙 Повернутися до головного меню", callback_data="main_menu")
-            )
-            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup, parse_mode="Markdown", disable_web_page_preview=True)
-
-        elif call.data == "about":
-            text = (
-                "👤 *Про компанію*\n\n"
-                "*Reliable Outsorsing Company* – бухгалтерська аутсорсингова компанія, яка наслідує європейський сервіс обслуговування та ділові відносини. Для нас важливий кожен клієнт і тому прагнемо забезпечити якісний сервіс обслуговування та задовільнити Ваші потреби. А професіоналізм і відповідальне ставлення до поставлених завдань підтверджено більш ніж 10-річним досвідом роботи з різними організаційними формами, видами діяльності та системами оподаткування.\n\n"
-                "*Надаємо професійні бухгалтерські послуги:*\n"
-                "✅ Бухгалтерське обслуговування для ФОП та ТОВ\n"
-                "✅ Консультація з питань вибору системи оподаткування при створенні підприємства\n"
-                "✅ Відкриття ФОП, підбір групи єдиного податку та КВЕДів, відкриття банківського рахунку\n"
-                "✅ Закриття ФОП, ліквідаційні звіти\n"
-                "✅ Формування та подання звітності в контролюючі органи\n"
-                "✅ Виготовлення ключів електронного цифрового підпису (ЕЦП/КЕП)\n"
-                "✅ Налагодження системи бухгалтерського обліку\n"
-                "✅ Нарахування заробітної плати, індексація, відпустки, лікарняні\n"
-                "✅ Оформлення первинних документів\n"
-                "✅ Консультація з питань необхідності використання РРО та ПРРО, реєстрація ПРРО\n"
-                "✅ Контроль сплати всіх податків, формування реквізитів, платіжних документів, контроль вчасної сплати та актуальності рахунків\n"
-                "✅ Консультація штатному бухгалтеру та допомога у вирішенні специфічних питань\n\n"
-                "📞 *Телефонуйте або пишіть нам у будь-який зручний для Вас час, а ми запропонуємо і впровадимо оптимальні варіанти, що підходять саме для Вашого бізнесу:*\n"
-                "📲 [Instagram](https://www.instagram.com/reliable_outsorsing_company/)\n"
-                "💬 Viber/Telegram: 098-159-75-70\n"
-                "✉️ e-Mail: r.o.c@ukr.net\n\n"
-                "Делегуйте ведення бухгалтерського обліку нам, спрямуйте час і ресурси на дійсно важливі процеси функціонування і розширення Вашого бізнесу та будуймо Україну майбутнього разом."
-            )
-            markup = InlineKeyboardMarkup(row_width=1).add(
-                InlineKeyboardButton("🔙 Повернутися до головного меню", callback_data="main_menu")
-            )
-            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup, parse_mode="Markdown", disable_web_page_preview=True)
-
-        elif call.data == "main_menu":
-            send_main_menu(chat_id)
-
+        router.callback(chat_id, message_id, call.data, call.from_user.username)
         bot.answer_callback_query(call.id)  # Підтверджуємо callback
 
     except Exception as e:
-        logger.error(f"Помилка обробки callback {call.data}: {e}")
+        logger.error("Помилка обробки callback %s: %s", call.data, e)
         bot.answer_callback_query(call.id, "Виникла помилка. Спробуйте ще раз.")
 
+    observe_handler(router.callback_label(call.data), started, chat_id, "Callback %s оброблено", call.data)
+
+# Inline-пошук тарифів: відповіді готові заздалегідь, Telegram кешує їх на INLINE_CACHE_TIME
+@bot.inline_handler(func=lambda query: True)
+def handle_inline(query):
+    started = time.perf_counter()
+    try:
+        bot.answer_inline_query(query.id, tariff_index.search(query.query), cache_time=INLINE_CACHE_TIME)
+    except Exception as e:
+        logger.error("Помилка відповіді на inline-запит %r: %s", query.query, e)
+    observe_handler("inline", started)
+
+# Асинхронний рушій створюється лише за потреби (потребує aiohttp)
+def create_async_engine():
+    from async_engine import AsyncEngine
+    return AsyncEngine(
+        BOT_TOKEN,
+        create_rate_limiter(),
+        router,
+        tariff_index=tariff_index,
+        journal=journal,
+        admin_commands={"broadcast": handle_broadcast, "stats": handle_stats},
+        is_admin=is_admin,
+        inline_cache_time=INLINE_CACHE_TIME,
+        concurrency=ASYNC_CONCURRENCY,
+        connection_limit=ASYNC_CONNECTION_LIMIT,
+        allowed_updates=ALLOWED_UPDATES
+    )
+
+# Експоненційна затримка з випадковим розкидом ("full jitter")
+def polling_backoff(attempt):
+    return random.uniform(0, min(POLLING_BACKOFF_MAX, POLLING_BACKOFF_BASE * 2 ** attempt))
+
 # Асинхронна функція для polling із повторними спробами
-async def run_polling():
-    logger.info("Запуск polling...")
+async def run_polling(engine=None):
+    import asyncio
+    logger.info("Запуск polling (рушій: %s)...", BOT_ENGINE)
+    attempt = 0
     while True:
+        started = time.monotonic()
         try:
-            await bot.polling(none_stop=True, interval=0, timeout=20)
+            if engine is None:
+                # Синхронний TeleBot блокує потік, тому виконуємо його поза event loop
+                await asyncio.to_thread(bot.polling, none_stop=True, interval=0, timeout=20, allowed_updates=ALLOWED_UPDATES)
+            else:
+                await engine.polling(timeout=20)
         except Exception as e:
-            logger.error(f"Помилка polling: {e}")
-            keep_alive()  # Пінгуємо сервер для підтримки активності
-            await asyncio.sleep(10)  # Чекаємо 10 секунд перед перезапуском
+            logger.error("Помилка polling: %s", e)
+            metrics.polling_restarts_total.inc()
+            # Після тривалої стабільної роботи починаємо відлік затримок спочатку
+            if time.monotonic() - started > POLLING_BACKOFF_MAX:
+                attempt = 0
+            delay = polling_backoff(attempt)
+            attempt += 1
+            logger.info("Перезапуск polling через %.1f с", delay)
+            await asyncio.sleep(delay)
 
 # Функція для запуску Flask у окремому потоці
 def run_flask():
     port = int(os.getenv("PORT", 10000))
-    app.run(host='0.0.0.0', port=port)
-
-# Запуск бота та Flask
-if __name__ == "__main__":
-    logger.info("Скрипт запущено")
+    create_app().run(host='0.0.0.0', port=port, threaded=True)
+
+# Контент і стан, без яких не обробити перше оновлення
+def load_content():
+    screens.load()
+    conversations.load()
+
+# Підготовка процесу до обробки оновлень: завантаження контенту та додаткові кроки
+# (мережеві запити до Bot API, імпорт Flask) виконуються паралельно, тривалість кожного — у лог
+def startup(**steps):
+    report = StartupReport()
+    report.record("import", IMPORT_SECONDS)
+    report.run_parallel({"content": load_content, **steps})
+    start_background_tasks()
+    report.log()
+
+# Фонові задачі процесу (запускаються в кожному процесі, що обробляє оновлення)
+def start_background_tasks():
+    screens.start_watcher(SCREENS_RELOAD_INTERVAL)
+    dispatcher.start()
+    journal.start()
+    outbox.start()
+    subscribers.start()
+    conversations.start()
+    lead_forwarder.start()
+    broadcaster.start()
+    funnel.start()
+
+# Запуск у режимі webhook без gunicorn (для продакшну див. Procfile та gunicorn.conf.py)
+def run_webhook():
+    startup(webhook=setup_webhook, http=create_app)
+    run_flask()
+
+# Webhook міг лишитися від запуску в режимі webhook, і тоді getUpdates повертає 409
+def delete_webhook():
     try:
         bot.remove_webhook()
         logger.info("Webhook видалено")
     except Exception as e:
-        logger.error(f"Помилка видалення webhook: {e}")
+        logger.error("Помилка видалення webhook: %s", e)
+
+# TeleBot.polling спершу запитує getMe (bot.user кешує відповідь) — робимо це паралельно з іншими кроками
+def prefetch_bot_user():
+    try:
+        bot.user
+    except Exception as e:
+        logger.error("Помилка запиту getMe: %s", e)
 
-    # Запускаємо Flask у окремому потоці
-    flask_thread = threading.Thread(target=run_flask)
-    flask_thread.daemon = True
+# HTTP-сервер (health-check, метрики) стартує у фоні; перше оновлення його не чекає
+def start_http_server():
+    flask_thread = threading.Thread(target=run_flask, name="http", daemon=True)
     flask_thread.start()
 
+# Запуск у режимі polling: Flask для health-check у фоні, polling в основному потоці
+def run_polling_mode():
+    import asyncio  # Потрібен лише тут, тож не імпортується разом з модулем
+    start_http_server()
+    keep_alive.start()
+    if BOT_ENGINE == "async":
+        startup(webhook=delete_webhook)
+        engine = create_async_engine()
+    else:
+        startup(webhook=delete_webhook, get_me=prefetch_bot_user)
+        engine = None
+
     # Запускаємо polling в основному потоці
+    asyncio.run(run_polling(engine))
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+# Запуск бота та Flask
+if __name__ == "__main__":
+    logger.info("Скрипт запущено (режим: %s)", BOT_MODE)
     try:
-        asyncio.run(run_polling())
+        if BOT_MODE == "webhook":
+            run_webhook()
+        else:
+            run_polling_mode()
     except Exception as e:
-        logger.error(f"Критична помилка запуску: {e}")
+        logger.error("Критична помилка запуску: %s", e)
         raise
@@ -0,0 +1,147 @@
+import bisect
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        if not items and not self.labels:
+            items = [((), 0)]
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+# Значення береться з функції в момент збору метрик
+class Gauge:
+    def __init__(self, name, help_text, getter):
+        self.name = name
+        self.help = help_text
+        self.getter = getter
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.getter()}"]
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._series.items()]
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name, help_text, getter):
+        return self.register(Gauge(name, help_text, getter))
+
+    # Текстовий формат Prometheus (text/plain; version=0.0.4)
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Метрики бота (окремо для кожного процесу)
+registry = Registry()
+started_at = time.time()
+last_update_at = None
+last_poll_at = None
+
+updates_total = registry.counter("bot_updates_total", "Отримані оновлення за типом", ("type",))
+handler_latency = registry.histogram("bot_handler_latency_seconds", "Час обробки оновлення", ("handler",))
+api_latency = registry.histogram("telegram_api_latency_seconds", "Час виконання запитів до Bot API", ("method",))
+api_errors_total = registry.counter("telegram_api_errors_total", "Помилки запитів до Bot API", ("method", "code"))
+rate_limited_total = registry.counter("bot_rate_limited_total", "Оновлення, відкинуті rate limiter", ("type",))
+edits_skipped_total = registry.counter("bot_edits_skipped_total", "Редагування, пропущені через незмінений вміст")
+duplicate_updates_total = registry.counter("bot_duplicate_updates_total", "Повторно доставлені оновлення, що були відкинуті")
+polling_restarts_total = registry.counter("bot_polling_restarts_total", "Перезапуски polling після помилки")
+registry.gauge("bot_uptime_seconds", "Час роботи процесу", lambda: round(time.time() - started_at, 3))
+registry.gauge(
+    "bot_seconds_since_last_update", "Час від останнього отриманого оновлення (-1 — оновлень ще не було)",
+    lambda: -1 if last_update_at is None else round(time.time() - last_update_at, 3)
+)
+registry.gauge(
+    "bot_seconds_since_last_poll", "Час від останнього завершеного getUpdates (-1 — ще не було)",
+    lambda: -1 if last_poll_at is None else round(time.time() - last_poll_at, 3)
+)
+
+
+def update_received(kind):
+    global last_update_at
+    last_update_at = time.time()
+    updates_total.inc(kind)
+
+
+def poll_completed():
+    global last_poll_at
+    last_poll_at = time.time()
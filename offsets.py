@@ -0,0 +1,126 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+# Журнал оброблених оновлень.
+#  - acknowledged — найбільший прийнятий update_id: його підтверджуємо Telegram як offset, тож
+#    getUpdates не повертає оновлення, що ще в обробці, і long-poll одразу віддає нові.
+#    (Підтвердження лише committed змушувало б кожен getUpdates повертати ще не оброблені оновлення
+#    й чекати на їх завершення — кожне нове оновлення отримувало б цю затримку.)
+#  - committed — найбільший update_id, до якого включно всі прийняті оновлення вже оброблені;
+#    саме він зберігається у файл (дописуванням рядків "update_id час_запису") і після перезапуску
+#    стає нижньою межею для відсіювання повторів.
+#  - Недавні update_id тримаються в кільцевому буфері: повторна доставка відкидається за O(1).
+#  - Telegram зберігає непідтверджені оновлення до 24 годин, тож журнал, старший за max_age секунд,
+#    нічого не захищає, зате після зміни бота (інший токен, нова нумерація update_id) відкидав би
+#    всі нові оновлення. Такий журнал ігнорується.
+class UpdateJournal:
+    COMPACT_SIZE = 64 * 1024
+
+    def __init__(self, path=None, dedup_size=10000, flush_interval=1.0, max_age=7 * 86400):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._recent = set()
+        self._order = deque(maxlen=dedup_size)
+        self._in_flight = set()
+        self._max_seen = self._load() if path else 0
+        self._start = self._max_seen
+        self._persisted = self._max_seen
+        self._thread = None
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="ascii") as f:
+                entries = [line.split() for line in f]
+            modified = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return 0
+        # Рядки попереднього формату містять лише update_id — для них беремо час зміни файлу
+        entries = [fields for fields in entries if fields and all(field.isdigit() for field in fields[:2])]
+        if not entries:
+            return 0
+        value = int(entries[-1][0])
+        saved_at = int(entries[-1][1]) if len(entries[-1]) > 1 else modified
+        age = time.time() - saved_at
+        if age > self.max_age:
+            logger.warning("Журнал оновлень застарів (%.1f дн.), update_id %s ігнорується", age / 86400, value)
+            return 0
+        logger.info("Журнал оновлень: продовжуємо після update_id %s", value)
+        return value
+
+    # False, якщо оновлення вже оброблялося (або обробляється)
+    def accept(self, update_id):
+        with self._lock:
+            if update_id <= self._start or update_id in self._recent:
+                return False
+            if len(self._order) == self._order.maxlen:
+                self._recent.discard(self._order[0])
+            self._order.append(update_id)
+            self._recent.add(update_id)
+            self._in_flight.add(update_id)
+            if update_id > self._max_seen:
+                self._max_seen = update_id
+            return True
+
+    # Оновлення не вдалося поставити в обробку — дозволяємо повторну доставку
+    def forget(self, update_id):
+        with self._lock:
+            self._recent.discard(update_id)
+            self._in_flight.discard(update_id)
+
+    def done(self, update_id):
+        with self._lock:
+            self._in_flight.discard(update_id)
+
+    @property
+    def acknowledged(self):
+        with self._lock:
+            return self._max_seen
+
+    @property
+    def committed(self):
+        with self._lock:
+            if self._in_flight:
+                return min(self._in_flight) - 1
+            return self._max_seen
+
+    def flush(self):
+        if not self.path:
+            return
+        committed = self.committed
+        if committed == self._persisted:
+            return
+        line = f"{committed} {int(time.time())}\n"
+        if os.path.exists(self.path) and os.path.getsize(self.path) > self.COMPACT_SIZE:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="ascii") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        else:
+            with open(self.path, "a", encoding="ascii") as f:
+                f.write(line)
+        self._persisted = committed
+
+    def start(self):
+        if not self.path or self._thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error("Помилка запису журналу оновлень: %s", e)
+
+        self._thread = threading.Thread(target=run, name="update-journal", daemon=True)
+        self._thread.start()
@@ -0,0 +1,200 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from telebot.apihelper import ApiTelegramException
+
+logger = logging.getLogger(__name__)
+
+# Менше значення — вищий пріоритет
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# Методи, що створюють нове повідомлення в чаті: лише між ними витримується per_chat_interval.
+# Редагування повідомлення, на кнопку якого натиснув користувач, відправляється одразу
+PACED_METHODS = frozenset(["send_message", "send_document"])
+
+
+class OutboxFull(Exception):
+    pass
+
+
+class _Job:
+    __slots__ = ("method", "chat_id", "kwargs", "priority", "edit_key", "futures", "attempts")
+
+    def __init__(self, method, chat_id, kwargs, priority, edit_key):
+        self.method = method
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.priority = priority
+        self.edit_key = edit_key
+        self.futures = [Future()]
+        self.attempts = 0
+
+
+# Планувальник вихідних запитів до Telegram:
+#  - глобальний token bucket (~30 повідомлень/сек на бота);
+#  - запити виконує пул із senders потоків; у кожного чату одночасно не більше одного запиту,
+#    тож порядок у межах чату зберігається, а повільний запит затримує лише свій чат;
+#  - нові повідомлення в чат — не частіше одного за per_chat_interval секунд;
+#  - між чатами — за пріоритетом, далі в порядку надходження;
+#  - 429 від Telegram призупиняє чат на retry_after і повторює запит;
+#  - нове редагування того самого повідомлення замінює ще не відправлене.
+class SendScheduler:
+    def __init__(self, bot, global_rate=30, per_chat_interval=1.0, max_queue=10000, max_retries=5, senders=8):
+        self.bot = bot
+        self.senders = senders
+        self.global_rate = global_rate
+        self.per_chat_interval = per_chat_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._chats = {}          # chat_id -> deque(_Job)
+        self._edits = {}          # (chat_id, message_id) -> _Job, що ще чекає в черзі
+        self._ready = []          # heap (priority, seq, chat_id) — чати, готові до відправки
+        self._waiting = []        # heap (not_before, seq, chat_id) — чати на паузі
+        self._scheduled = set()   # чати, що вже є в _ready або _waiting
+        self._last_sent = {}      # chat_id -> час останнього нового повідомлення (PACED_METHODS)
+        self._depth = 0
+        self._tokens = float(global_rate)
+        self._tokens_at = time.monotonic()
+        self._tokens_lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            for index in range(self.senders):
+                thread = threading.Thread(target=self._run, name=f"send-scheduler-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def depth(self):
+        return self._depth
+
+    def submit(self, method, chat_id, priority=PRIORITY_INTERACTIVE, **kwargs):
+        edit_key = None
+        if method == "edit_message_text" and kwargs.get("message_id") is not None:
+            edit_key = (chat_id, kwargs["message_id"])
+        with self._cond:
+            pending = self._edits.get(edit_key) if edit_key else None
+            if pending is not None:
+                # Відправиться лише останній вміст; обидва виклики отримають один результат
+                pending.kwargs = dict(kwargs, chat_id=chat_id)
+                pending.priority = min(pending.priority, priority)
+                future = Future()
+                pending.futures.append(future)
+                return future
+            if self._depth >= self.max_queue:
+                raise OutboxFull(f"Черга відправки переповнена ({self._depth})")
+            job = _Job(method, chat_id, dict(kwargs, chat_id=chat_id), priority, edit_key)
+            self._chats.setdefault(chat_id, deque()).append(job)
+            if edit_key:
+                self._edits[edit_key] = job
+            self._depth += 1
+            if chat_id not in self._scheduled:
+                self._schedule(chat_id, self._not_before(job), priority)
+            self._cond.notify()
+            return job.futures[0]
+
+    def _not_before(self, job):
+        if job.method in PACED_METHODS:
+            return self._last_sent.get(job.chat_id, 0) + self.per_chat_interval
+        return 0
+
+    def _schedule(self, chat_id, not_before, priority):
+        self._scheduled.add(chat_id)
+        if not_before <= time.monotonic():
+            heapq.heappush(self._ready, (priority, next(self._seq), chat_id))
+        else:
+            heapq.heappush(self._waiting, (not_before, next(self._seq), chat_id))
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._waiting and self._waiting[0][0] <= now:
+                    _, _, chat_id = heapq.heappop(self._waiting)
+                    heapq.heappush(self._ready, (self._chats[chat_id][0].priority, next(self._seq), chat_id))
+                if self._ready:
+                    _, _, chat_id = heapq.heappop(self._ready)
+                    job = self._chats[chat_id].popleft()
+                    if job.edit_key:
+                        self._edits.pop(job.edit_key, None)
+                    return job
+                timeout = self._waiting[0][0] - now if self._waiting else None
+                self._cond.wait(timeout)
+
+    def _take_global_token(self):
+        while True:
+            with self._tokens_lock:
+                now = time.monotonic()
+                self._tokens = min(float(self.global_rate), self._tokens + (now - self._tokens_at) * self.global_rate)
+                self._tokens_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.global_rate
+            time.sleep(wait)
+
+    def _finish(self, job, retry_after=None):
+        with self._cond:
+            now = time.monotonic()
+            chat_id = job.chat_id
+            if retry_after is not None:
+                # Повертаємо запит на початок черги чату, щоб зберегти порядок
+                self._chats[chat_id].appendleft(job)
+                if job.edit_key:
+                    self._edits[job.edit_key] = job
+                self._schedule(chat_id, now + retry_after, job.priority)
+            else:
+                self._depth -= 1
+                if job.method in PACED_METHODS:
+                    self._last_sent[chat_id] = now
+                if self._chats[chat_id]:
+                    head = self._chats[chat_id][0]
+                    self._schedule(chat_id, self._not_before(head), head.priority)
+                else:
+                    del self._chats[chat_id]
+                    self._scheduled.discard(chat_id)
+                    if len(self._last_sent) > self.max_queue:
+                        self._prune_last_sent(now)
+            self._cond.notify()
+
+    def _prune_last_sent(self, now):
+        for chat_id, sent_at in list(self._last_sent.items()):
+            if now - sent_at > self.per_chat_interval:
+                del self._last_sent[chat_id]
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            self._take_global_token()
+            try:
+                result = getattr(self.bot, job.method)(**job.kwargs)
+            except ApiTelegramException as e:
+                job.attempts += 1
+                if e.error_code == 429 and job.attempts <= self.max_retries:
+                    retry_after = (e.result_json.get("parameters") or {}).get("retry_after", 1)
+                    logger.warning("Flood limit для %s: повтор %s через %s с", job.chat_id, job.method, retry_after)
+                    self._finish(job, retry_after=retry_after)
+                    continue
+                self._fail(job, e)
+            except Exception as e:
+                self._fail(job, e)
+            else:
+                self._finish(job)
+                for future in job.futures:
+                    future.set_result(result)
+
+    def _fail(self, job, error):
+        logger.error("Помилка %s для %s: %s", job.method, job.chat_id, error)
+        self._finish(job)
+        for future in job.futures:
+            future.set_exception(error)
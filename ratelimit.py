@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from storage import connect
+
+logger = logging.getLogger(__name__)
+
+
+# Обчислення нового стану відра: поповнення з моменту останнього звернення та спроба взяти токен
+def _refill_and_take(state, rate, burst, now, ttl):
+    if state is None or now - state[1] > ttl:
+        tokens = float(burst)
+    else:
+        tokens = min(float(burst), state[0] + (now - state[1]) * rate)
+    if tokens >= 1:
+        return True, tokens - 1
+    return False, tokens
+
+
+# Сховище відер у пам'яті процесу: LRU з TTL та жорстким лімітом кількості записів
+class MemoryBucketStore:
+    blocking = False
+
+    def __init__(self, max_entries=10000, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        with self._lock:
+            allowed, tokens = _refill_and_take(self._buckets.pop(key, None), rate, burst, now, self.ttl)
+            self._buckets[key] = (tokens, now)
+            # Найстаріші записи на початку: видаляємо прострочені та все понад ліміт
+            while self._buckets:
+                oldest_key, (_, updated) = next(iter(self._buckets.items()))
+                if len(self._buckets) <= self.max_entries and now - updated <= self.ttl:
+                    break
+                del self._buckets[oldest_key]
+            return allowed
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rate_buckets_updated ON rate_buckets (updated);
+"""
+
+
+# Спільне сховище для кількох воркерів gunicorn: SQLite у режимі WAL.
+# Ліміт кількості записів перевіряється при кожному додаванні нового ключа, прострочені записи
+# видаляються раз на CLEANUP_EVERY звернень. Звернення блокує потік (до timeout на блокуванні бази)
+class SQLiteBucketStore:
+    CLEANUP_EVERY = 1000
+    blocking = True
+
+    def __init__(self, path, max_entries=10000, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._conn = connect(path, SCHEMA, timeout=1)
+        self._lock = threading.Lock()
+        self._ops = 0
+
+    def take(self, key, rate, burst, now):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                state = self._conn.execute(
+                    "SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                allowed, tokens = _refill_and_take(state, rate, burst, now, self.ttl)
+                if state is None:
+                    self._evict_oldest(self.max_entries - 1)
+                self._conn.execute(
+                    "INSERT INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (key, tokens, now)
+                )
+                self._ops += 1
+                if self._ops % self.CLEANUP_EVERY == 0:
+                    self._cleanup(now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return allowed
+
+    def _cleanup(self, now):
+        self._conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - self.ttl,))
+
+    # Залишає не більше keep записів, видаляючи найдавніше оновлені
+    def _evict_oldest(self, keep):
+        self._conn.execute(
+            "DELETE FROM rate_buckets WHERE key IN ("
+            "SELECT key FROM rate_buckets ORDER BY updated LIMIT max(0, (SELECT COUNT(*) FROM rate_buckets) - ?))",
+            (keep,)
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rate_buckets").fetchone()[0]
+
+
+# Token bucket з окремими лімітами (rate токенів/сек, burst) для кожного типу оновлень
+class TokenBucketLimiter:
+    def __init__(self, store, limits):
+        self.store = store
+        self.limits = limits
+
+    def allow(self, kind, chat_id):
+        if kind not in self.limits:
+            return True
+        rate, burst = self.limits[kind]
+        try:
+            return self.store.take(f"{kind}:{chat_id}", rate, burst, time.time())
+        except Exception as e:
+            # Збій сховища не повинен блокувати користувачів
+            logger.error("Помилка rate limiter: %s", e)
+            return True
@@ -0,0 +1,43 @@
+import threading
+from collections import OrderedDict
+
+
+# Відбиток вмісту повідомлення: текст і вже серіалізована клавіатура
+def render_fingerprint(text, reply_markup):
+    return hash((text, reply_markup))
+
+
+# Telegram відхиляє редагування без змін ("message is not modified")
+def is_not_modified(error):
+    return "message is not modified" in str(error)
+
+
+# Обмежений LRU-кеш останнього відображеного вмісту для кожного (chat_id, message_id)
+class RenderCache:
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chat_id, message_id):
+        with self._lock:
+            fingerprint = self._entries.get((chat_id, message_id))
+            if fingerprint is not None:
+                self._entries.move_to_end((chat_id, message_id))
+            return fingerprint
+
+    def put(self, chat_id, message_id, fingerprint):
+        with self._lock:
+            self._entries[(chat_id, message_id)] = fingerprint
+            self._entries.move_to_end((chat_id, message_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Видаляє запис, лише якщо в ньому досі саме цей вміст (новіше редагування не чіпаємо)
+    def discard(self, chat_id, message_id, fingerprint):
+        with self._lock:
+            if self._entries.get((chat_id, message_id)) == fingerprint:
+                del self._entries[(chat_id, message_id)]
+
+    def __len__(self):
+        return len(self._entries)
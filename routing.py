@@ -0,0 +1,72 @@
+import logging
+import time
+
+import metrics
+from leads import CALLBACKS as LEAD_CALLBACKS
+
+logger = logging.getLogger(__name__)
+
+
+# Спільна для обох рушіїв (TeleBot і AsyncTeleBot) частина обробки оновлень: облік підписників
+# і воронки, пошук екрана за call.data, сценарій заявки. Екрани лише ставляться в чергу відправки
+# (send_screen/edit_screen), тож методи не чекають на мережу. Відповідь на callback і вимірювання
+# часу обробника (observe_handler) — у рушії, бо там відомо, коли обробку завершено
+class UpdateRouter:
+    def __init__(self, screens, send_screen, edit_screen, subscribers, funnel, lead_flow):
+        self.screens = screens
+        self.send_screen = send_screen
+        self.edit_screen = edit_screen
+        self.subscribers = subscribers
+        self.funnel = funnel
+        self.lead_flow = lead_flow
+
+    def send_main_menu(self, chat_id):
+        try:
+            self.send_screen(chat_id, self.screens.get("main_menu"))
+            logger.info("Головне меню поставлено в чергу для chat_id: %s", chat_id)
+        except Exception as e:
+            logger.error("Помилка відправки головного меню: %s", e)
+
+    def start(self, chat_id):
+        self.subscribers.touch(chat_id)
+        self.lead_flow.store.delete(chat_id)  # /start перериває незавершену заявку
+        self.funnel.record(chat_id, "start")
+        self.send_main_menu(chat_id)
+
+    # Винятки (напр. OutboxFull) прокидаються: рушій відповідає на callback повідомленням про помилку
+    def callback(self, chat_id, message_id, data, username=None):
+        self.subscribers.touch(chat_id)
+        if data in self.screens or data in LEAD_CALLBACKS:
+            self.funnel.record(chat_id, data)
+        screen = self.screens.get(data)
+        if screen is None:
+            if not self.lead_flow.on_callback(chat_id, data, username):
+                logger.warning("Невідомий callback: %s", data)
+        elif screen.action == "send":
+            self.send_screen(chat_id, screen)
+        else:
+            self.edit_screen(chat_id, message_id, screen)
+
+    # Мітка для метрик — лише відомі екрани, щоб довільний call.data не роздував кількість серій
+    def callback_label(self, data):
+        if data in self.screens:
+            return data
+        return "lead" if data in LEAD_CALLBACKS else "unknown"
+
+    def lead_active(self, chat_id):
+        return self.lead_flow.active(chat_id)
+
+    def lead_message(self, chat_id, text=None, phone=None):
+        try:
+            self.lead_flow.on_message(chat_id, text, phone)
+        except Exception as e:
+            logger.error("Помилка обробки заявки від %s: %s", chat_id, e)
+
+
+# Час обробника в метриці handler_latency (мітка — екран, "start", "inline" тощо)
+# і, якщо передано message, підсумковий запис у лог
+def observe_handler(label, started, chat_id=None, message=None, *args):
+    elapsed = time.perf_counter() - started
+    metrics.handler_latency.observe(elapsed, label)
+    if message is not None:
+        logger.info(message, *args, extra={"chat_id": chat_id, "latency_ms": round(elapsed * 1000, 2)})
@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+logger = logging.getLogger(__name__)
+
+PARSE_MODES = (None, "Markdown", "MarkdownV2", "HTML")
+ACTIONS = ("edit", "send")
+MAX_TEXT_LENGTH = 4096
+MAX_CALLBACK_DATA = 64
+
+# Незмінний екран: текст і клавіатура готуються один раз при завантаженні,
+# reply_markup зберігається вже серіалізованим у JSON
+Screen = namedtuple("Screen", ["key", "action", "text", "parse_mode", "reply_markup", "disable_web_page_preview"])
+
+
+def _expand_buttons(key, buttons, templates):
+    expanded = []
+    for button in buttons:
+        if "include" in button:
+            if button["include"] not in templates:
+                raise ValueError(f"Екран {key}: невідомий шаблон {button['include']}")
+            expanded.extend(templates[button["include"]])
+        else:
+            expanded.append(button)
+    return expanded
+
+
+def _build_markup(key, buttons, row_width):
+    markup = InlineKeyboardMarkup(row_width=row_width)
+    for button in buttons:
+        if "callback_data" in button:
+            if len(button["callback_data"].encode("utf-8")) > MAX_CALLBACK_DATA:
+                raise ValueError(f"Екран {key}: callback_data {button['callback_data']} довший за {MAX_CALLBACK_DATA} байт")
+            markup.add(InlineKeyboardButton(button["text"], callback_data=button["callback_data"]))
+        elif "url" in button:
+            markup.add(InlineKeyboardButton(button["text"], url=button["url"]))
+        else:
+            raise ValueError(f"Екран {key}: кнопка {button.get('text')} без callback_data чи url")
+    return markup
+
+
+# Будує та перевіряє словник екранів із вмісту контент-файлу
+def build_screens(data, extra_callbacks=()):
+    templates = data.get("templates", {})
+    screens = {}
+    targets = []
+    for key, spec in data["screens"].items():
+        text = spec["text"]
+        if isinstance(text, list):
+            text = "\n".join(text)
+        if not text or len(text) > MAX_TEXT_LENGTH:
+            raise ValueError(f"Екран {key}: текст порожній або довший за {MAX_TEXT_LENGTH} символів")
+        parse_mode = spec.get("parse_mode")
+        if parse_mode not in PARSE_MODES:
+            raise ValueError(f"Екран {key}: невідомий parse_mode {parse_mode}")
+        action = spec.get("action", "edit")
+        if action not in ACTIONS:
+            raise ValueError(f"Екран {key}: невідома дія {action}")
+        buttons = _expand_buttons(key, spec.get("buttons", []), templates)
+        markup = _build_markup(key, buttons, spec.get("row_width", 1))
+        targets.extend((key, b["callback_data"]) for b in buttons if "callback_data" in b)
+        screens[key] = Screen(
+            key=key,
+            action=action,
+            text=text,
+            parse_mode=parse_mode,
+            reply_markup=markup.to_json() if buttons else None,
+            disable_web_page_preview=spec.get("disable_web_page_preview"),
+        )
+    for key, target in targets:
+        if target not in screens and target not in extra_callbacks:
+            raise ValueError(f"Екран {key}: кнопка веде на невідомий екран {target}")
+    return screens
+
+
+# Реєстр екранів з O(1) пошуком за callback_data та гарячим перезавантаженням файлу
+class ScreenRegistry:
+    def __init__(self, path, extra_callbacks=()):
+        self.path = path
+        self.extra_callbacks = frozenset(extra_callbacks)
+        self._screens = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._listeners = []
+
+    # listener(registry) викликається після кожного успішного (пере)завантаження
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def load(self):
+        with self._lock:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            # Заміна посилання атомарна: обробники бачать або старий, або новий набір екранів
+            self._screens = build_screens(data, self.extra_callbacks)
+            self._mtime = mtime
+        logger.info("Завантажено %s екранів з %s", len(self._screens), self.path)
+        for listener in self._listeners:
+            listener(self)
+
+    def reload_if_changed(self):
+        try:
+            if os.stat(self.path).st_mtime == self._mtime:
+                return False
+            self.load()
+            return True
+        except Exception as e:
+            # Некоректний файл не повинен ламати роботу — лишаємо попередню версію
+            logger.error("Помилка перезавантаження екранів з %s: %s", self.path, e)
+            return False
+
+    def start_watcher(self, interval):
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                self.reload_if_changed()
+
+        self._watcher = threading.Thread(target=watch, name="screens-watcher", daemon=True)
+        self._watcher.start()
+
+    def get(self, key):
+        return self._screens.get(key)
+
+    def __contains__(self, key):
+        return key in self._screens
+
+    def keys(self):
+        return self._screens.keys()
@@ -0,0 +1,135 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+# Зведення варіантів написання: апострофи, російська розкладка, і/ї/є, ґ
+_FOLD = str.maketrans({
+    "’": None, "ʼ": None, "'": None, "`": None,
+    "ґ": "г", "є": "е", "ї": "и", "і": "и",
+    "ё": "е", "ы": "и", "э": "е", "ъ": None,
+})
+_WORD = re.compile(r"\w+")
+_MARKDOWN = re.compile(r"[*_`\[\]]")
+# Відмінкові закінчення (вже після _FOLD), найдовші — першими
+_ENDINGS = (
+    "ями", "ами", "ого", "ому", "ими", "ией",
+    "ою", "ею", "ом", "ем", "ов", "ив", "ах", "ях", "ии", "ий", "ои", "ая",
+    "а", "я", "и", "у", "ю", "о", "е", "ь",
+)
+MIN_STEM = 3
+
+
+def _stem(token):
+    for ending in _ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= MIN_STEM:
+            return token[:-len(ending)]
+    return token
+
+
+def normalize(text):
+    return [_stem(token) for token in _WORD.findall(text.casefold().translate(_FOLD))]
+
+
+def _prefix_index(documents):
+    index = {}
+    for doc_id, text in enumerate(documents):
+        for stem in normalize(text):
+            for end in range(1, len(stem) + 1):
+                index.setdefault(stem[:end], set()).add(doc_id)
+    return {prefix: frozenset(ids) for prefix, ids in index.items()}
+
+
+# Стаття з JSON, серіалізованим один раз: telebot кличе to_json на кожну відповідь
+class _PrebuiltArticle(types.InlineQueryResultArticle):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._json = super().to_json()
+
+    def to_json(self):
+        return self._json
+
+
+# Inline-пошук тарифів: префіксний інвертований індекс по нормалізованих основах слів
+# і готові InlineQueryResultArticle будуються при завантаженні екранів; запит — це кілька
+# перетинів frozenset, а відповіді на однакові запити беруться з LRU-кешу
+class TariffIndex:
+    def __init__(self, tariffs, bot_username=None, cache_size=1024):
+        self.tariffs = tariffs
+        self.bot_username = bot_username
+        self.cache_size = cache_size
+        self._state = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _article(self, key, title, screen):
+        lines = [line for line in _MARKDOWN.sub("", screen.text).splitlines() if line.strip()]
+        content = types.InputTextMessageContent(
+            screen.text,
+            parse_mode=screen.parse_mode,
+            link_preview_options=types.LinkPreviewOptions(is_disabled=True) if screen.disable_web_page_preview else None
+        )
+        markup = None
+        if self.bot_username:
+            markup = types.InlineKeyboardMarkup()
+            markup.add(types.InlineKeyboardButton("💬 Відкрити бота", url=f"https://t.me/{self.bot_username}"))
+        return _PrebuiltArticle(
+            key,
+            title,
+            content,
+            reply_markup=markup,
+            description=lines[1] if len(lines) > 1 else None
+        )
+
+    # Перебудова з реєстру екранів (підписується через ScreenRegistry.add_listener)
+    def rebuild(self, screens):
+        keys, titles, texts, results = [], [], [], []
+        for key, title in self.tariffs.items():
+            screen = screens.get(key)
+            if screen is None:
+                continue
+            keys.append(key)
+            titles.append(title)
+            texts.append(f"{title}\n{_MARKDOWN.sub('', screen.text)}")
+            results.append(self._article(key, title, screen))
+        state = (_prefix_index(texts), _prefix_index(titles), tuple(results))
+        with self._lock:
+            self._state = state
+            self._cache.clear()
+        logger.info("Індекс inline-пошуку: %s тарифів", len(results))
+
+    def search(self, query):
+        with self._lock:
+            cached = self._cache.get(query)
+            if cached is not None:
+                self._cache.move_to_end(query)
+                return cached
+            state = self._state
+        if state is None:
+            return ()
+        text_index, title_index, results = state
+        stems = normalize(query)
+        if not stems:
+            found = results
+        else:
+            ids = None
+            for stem in stems:
+                matches = text_index.get(stem)
+                if not matches:
+                    ids = ()
+                    break
+                ids = matches if ids is None else ids & matches
+            # Збіги в назві тарифу — вище, далі порядок з меню
+            found = tuple(results[i] for i in sorted(
+                ids, key=lambda i: (-sum(i in title_index.get(stem, ()) for stem in stems), i)
+            ))
+        with self._lock:
+            if self._state is state:
+                self._cache[query] = found
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return found
@@ -0,0 +1,58 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+# Скільки секунд минуло від запуску процесу (Linux, за /proc); None, якщо невідомо
+def process_age():
+    try:
+        with open("/proc/self/stat") as f:
+            # Після назви процесу в дужках поле starttime — двадцяте
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# Звіт про старт процесу: тривалість кожної фази в мс. Незалежні фази (мережеві запити,
+# читання файлів, імпорт Flask) виконуються паралельно, тож загальний час — це найдовша з них
+class StartupReport:
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.phases[name] = seconds
+
+    def _timed(self, name, step):
+        started = time.perf_counter()
+        try:
+            return step()
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    # steps — {назва: функція без аргументів}; помилка кроку передається далі після завершення всіх кроків
+    def run_parallel(self, steps):
+        if not steps:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix="startup") as pool:
+            futures = {name: pool.submit(self._timed, name, step) for name, step in steps.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    def log(self):
+        total = time.perf_counter() - self.started
+        with self._lock:
+            phases = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in self.phases.items())
+        age = process_age()
+        logger.info(
+            "Старт завершено за %.0f мс (%s); від запуску процесу: %s",
+            total * 1000, phases, "невідомо" if age is None else f"{age * 1000:.0f} мс"
+        )
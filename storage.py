@@ -0,0 +1,12 @@
+import sqlite3
+
+
+# Спільне підключення до бази бота: автокоміт (транзакції — явним BEGIN), WAL і synchronous=NORMAL,
+# тож читачі не блокують запис, а з'єднання можна використовувати з кількох потоків під власним lock
+def connect(path, schema=None, timeout=5):
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if schema:
+        conn.executescript(schema)
+    return conn
@@ -0,0 +1,270 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from telebot.apihelper import ApiTelegramException
+
+from outbox import PRIORITY_BULK, OutboxFull
+from storage import connect
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscribers (
+    chat_id INTEGER PRIMARY KEY,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'active'
+);
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    admin_chat_id INTEGER NOT NULL,
+    created REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    cursor INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+    broadcast_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    PRIMARY KEY (broadcast_id, chat_id)
+);
+"""
+
+
+# Реєстр підписників: звернення накопичуються в пам'яті й записуються в SQLite пачками
+class SubscriberStore:
+    def __init__(self, path, flush_interval=5, flush_batch=500):
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._conn = connect(path, SCHEMA)
+        self._db_lock = threading.Lock()
+        self._buffer = {}
+        self._buffer_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    # Виклик з обробника: лише запис у словник, без звернення до диска
+    def touch(self, chat_id):
+        with self._buffer_lock:
+            self._buffer[chat_id] = time.time()
+            if len(self._buffer) >= self.flush_batch:
+                self._wakeup.set()
+
+    def flush(self):
+        with self._buffer_lock:
+            batch, self._buffer = self._buffer, {}
+        if not batch:
+            return 0
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO subscribers (chat_id, first_seen, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET last_seen = excluded.last_seen, status = 'active'",
+                [(chat_id, seen, seen) for chat_id, seen in batch.items()]
+            )
+            self._conn.execute("COMMIT")
+        return len(batch)
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        def run():
+            while True:
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error("Помилка запису підписників: %s", e)
+
+        self._thread = threading.Thread(target=run, name="subscribers-flush", daemon=True)
+        self._thread.start()
+
+    # Активні підписники порціями за зростанням chat_id (keyset-пагінація, без завантаження всіх у пам'ять)
+    def active_after(self, cursor, limit):
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT chat_id FROM subscribers WHERE status = 'active' AND chat_id > ? ORDER BY chat_id LIMIT ?",
+                (cursor, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def set_status(self, chat_ids, status):
+        if not chat_ids:
+            return
+        with self._db_lock:
+            self._conn.executemany(
+                "UPDATE subscribers SET status = ? WHERE chat_id = ?",
+                [(status, chat_id) for chat_id in chat_ids]
+            )
+
+    def count(self):
+        with self._db_lock:
+            return self._conn.execute("SELECT COUNT(*) FROM subscribers WHERE status = 'active'").fetchone()[0]
+
+
+# Статус доставки за помилкою Telegram
+def delivery_status(error):
+    if isinstance(error, ApiTelegramException):
+        description = (error.result_json or {}).get("description", "").lower()
+        if error.error_code == 403 and "blocked" in description:
+            return "blocked"
+        if error.error_code == 403 and "deactivated" in description:
+            return "deactivated"
+        if error.error_code in (400, 403) and "chat not found" in description:
+            return "not_found"
+    return "failed"
+
+
+class LeaseLost(Exception):
+    pass
+
+
+# Розсилка: підписники читаються порціями, доставка йде через чергу відправки з низьким пріоритетом.
+# Прогрес (cursor) зберігається після кожної порції, тож після перезапуску розсилка продовжується.
+# Оренда (lease) гарантує, що розсилку обробляє лише один процес.
+class Broadcaster:
+    LEASE_SECONDS = 120
+
+    def __init__(self, path, store, outbox, notify, chunk_size=200):
+        self.store = store
+        self.outbox = outbox
+        self.notify = notify
+        self.chunk_size = chunk_size
+        self.owner = f"{os.getpid()}-{id(self)}"
+        self._conn = connect(path, SCHEMA)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def create(self, text, admin_chat_id):
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO broadcasts (text, admin_chat_id, created) VALUES (?, ?, ?)",
+                (text, admin_chat_id, time.time())
+            )
+        self._wakeup.set()
+        return cur.lastrowid
+
+    def progress(self, broadcast_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status FROM broadcasts WHERE id = ?", (broadcast_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM broadcast_deliveries WHERE broadcast_id = ? GROUP BY status",
+                (broadcast_id,)
+            ).fetchall())
+        return row[0], counts
+
+    def last_id(self):
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(id) FROM broadcasts").fetchone()
+        return row[0]
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="broadcaster", daemon=True)
+        self._thread.start()
+
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT id, text, admin_chat_id, cursor FROM broadcasts "
+                "WHERE status = 'running' AND (lease_owner = ? OR lease_until < ?) ORDER BY id LIMIT 1",
+                (self.owner, now)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE broadcasts SET lease_owner = ?, lease_until = ? WHERE id = ?",
+                    (self.owner, now + self.LEASE_SECONDS, row[0])
+                )
+            self._conn.execute("COMMIT")
+        return row
+
+    def _run(self):
+        while True:
+            try:
+                job = self._claim()
+                if job is None:
+                    self._wakeup.wait(30)
+                    self._wakeup.clear()
+                    continue
+                self._deliver(*job)
+            except Exception as e:
+                logger.error("Помилка розсилки: %s", e)
+                time.sleep(5)
+
+    def _submit(self, chat_id, text):
+        while True:
+            try:
+                return self.outbox.submit("send_message", chat_id, priority=PRIORITY_BULK, text=text)
+            except OutboxFull:
+                time.sleep(1)
+
+    # Порція може чекати в черзі відправки довше за оренду (flood-ліміти, інтерактивні запити попереду),
+    # тож під час очікування оренда продовжується — інакше розсилку підхопив би інший процес
+    def _wait(self, broadcast_id, future):
+        while True:
+            try:
+                return future.exception(timeout=self.LEASE_SECONDS / 4)
+            except FutureTimeoutError:
+                self._extend_lease(broadcast_id)
+
+    def _extend_lease(self, broadcast_id):
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE broadcasts SET lease_until = ? WHERE id = ? AND lease_owner = ?",
+                (time.time() + self.LEASE_SECONDS, broadcast_id, self.owner)
+            ).rowcount
+        if not updated:
+            raise LeaseLost(f"Розсилку #{broadcast_id} вже обробляє інший процес")
+
+    def _deliver(self, broadcast_id, text, admin_chat_id, cursor):
+        logger.info("Розсилка #%s: продовження з chat_id > %s", broadcast_id, cursor)
+        while True:
+            chat_ids = self.store.active_after(cursor, self.chunk_size)
+            if not chat_ids:
+                break
+            futures = [(chat_id, self._submit(chat_id, text)) for chat_id in chat_ids]
+            results = []
+            for chat_id, future in futures:
+                error = self._wait(broadcast_id, future)
+                results.append((broadcast_id, chat_id, "sent" if error is None else delivery_status(error),
+                                None if error is None else str(error)[:500]))
+            for status in ("blocked", "deactivated", "not_found"):
+                self.store.set_status([r[1] for r in results if r[2] == status], status)
+            cursor = chat_ids[-1]
+            with self._lock:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO broadcast_deliveries (broadcast_id, chat_id, status, error) VALUES (?, ?, ?, ?)",
+                    results
+                )
+                self._conn.execute(
+                    "UPDATE broadcasts SET cursor = ?, lease_until = ? WHERE id = ?",
+                    (cursor, time.time() + self.LEASE_SECONDS, broadcast_id)
+                )
+                self._conn.execute("COMMIT")
+        with self._lock:
+            self._conn.execute("UPDATE broadcasts SET status = 'done', lease_owner = NULL WHERE id = ?", (broadcast_id,))
+        _, counts = self.progress(broadcast_id)
+        logger.info("Розсилка #%s завершена: %s", broadcast_id, counts)
+        self.notify(admin_chat_id, f"Розсилка #{broadcast_id} завершена: {format_counts(counts)}")
+
+
+def format_counts(counts):
+    return ", ".join(f"{status}: {n}" for status, n in sorted(counts.items())) or "немає отримувачів"